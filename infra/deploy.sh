@@ -25,5 +25,11 @@ bash <(jq --raw-output '.[] | "echo \(.contents | @sh) > \"$repo/places/\(.name
 bash <(jq --raw-output '.[] | "echo \(.image | @sh) > \"$repo/raw/food/\(.name | @sh)\""' "$json")
 
 # Build and publish project
-"$venv/bin/python" "$repo/vilf" build
-gsutil -m rsync -R "$repo/build" "$VILF_GCS_BUCKET"
+"$venv/bin/python" "$repo/vilf" build --minify --geojson dictionary --tiles
+"$venv/bin/python" "$repo/vilf" stage "$repo/build" "$repo/publish"
+# fingerprinted assets first, so no page links to one that is not uploaded yet
+immutable="Cache-Control:public, max-age=31536000, immutable"
+gsutil -m -h "$immutable" rsync -R "$repo/publish/plain-immutable" "$VILF_GCS_BUCKET"
+gsutil -m -h "$immutable" -h "Content-Encoding:gzip" rsync -R "$repo/publish/gzip-immutable" "$VILF_GCS_BUCKET"
+gsutil -m rsync -R "$repo/publish/plain" "$VILF_GCS_BUCKET"
+gsutil -m -h "Content-Encoding:gzip" rsync -R "$repo/publish/gzip" "$VILF_GCS_BUCKET"
@@ -0,0 +1,64 @@
+"""
+Module to give static assets content-hashed URLs that can be cached forever
+"""
+import json
+from pathlib import Path
+from typing import Optional
+
+# top level directories of static/ whose files are fingerprinted. Everything
+# else keeps its name, since other sites, browsers and reviews ask for it by name
+FINGERPRINT_DIRS = {"img"}
+FINGERPRINT_LENGTH = 10
+ASSET_MANIFEST_NAME = "assets.json"
+
+
+def fingerprint(path: Path, digest: str) -> Path:
+    """e.g. img/food/a16.jpg -> img/food/a16.0123456789.jpg"""
+    return path.with_name(f"{path.stem}.{digest[:FINGERPRINT_LENGTH]}{path.suffix}")
+
+
+class AssetManifest:
+    """
+    Maps the URL of every fingerprinted asset to its content-hashed URL.
+
+    The hashed name changes whenever the content does, so the files behind
+    hashed URLs never change and can be served as immutable. Only the HTML
+    entry points that link to them need short cache lifetimes.
+    """
+
+    def __init__(self):
+        # e.g. {"/img/food/a16.jpg": "/img/food/a16.0123456789.jpg"}
+        self.urls: dict[str, str] = {}
+
+    def add(self, path: Path, digest: str) -> Path:
+        """Record an asset at path (relative to the site root), return its new path"""
+        fingerprinted = fingerprint(path, digest)
+        self.urls[f"/{path}"] = f"/{fingerprinted}"
+        return fingerprinted
+
+    def __contains__(self, url: str) -> bool:
+        return url in self.urls
+
+    def url(self, url: Optional[str]) -> Optional[str]:
+        """
+        Look up the fingerprinted URL of an asset, passing None through.
+
+        Raises KeyError for URLs that are not fingerprinted, so a stale link is
+        caught by the build rather than by a 404.
+        """
+        if url is None:
+            return None
+        try:
+            return self.urls[url]
+        except KeyError:
+            raise KeyError(f"{url} is not a fingerprinted asset") from None
+
+    def to_json(self) -> str:
+        return json.dumps(self.urls, indent=1, sort_keys=True)
+
+
+def load_fingerprinted(build_dir: Path) -> set[Path]:
+    """Paths under build_dir of every fingerprinted asset in its manifest"""
+    with open(build_dir / ASSET_MANIFEST_NAME) as f:
+        urls = json.load(f)
+    return {build_dir / url.lstrip("/") for url in urls.values()}
@@ -0,0 +1,426 @@
+"""
+Module to measure how the build scales on synthetic catalogs
+"""
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+import click
+from PIL import Image, ImageDraw
+
+from .images import RAW_DIR
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+RESULTS_PATH = Path(".cache/benchmark-results.jsonl")
+# distinct synthetic photos, every place with a photo gets a copy of one of them
+PHOTO_VARIETY = 16
+# CLI invocations timed by --startup, in a catalog without places
+STARTUP_COMMANDS = {"help": ["--help"], "build": ["build"]}
+# roughly the San Francisco Bay Area
+LAT_RANGE = (37.2, 38.1)
+LON_RANGE = (-122.6, -121.8)
+
+CUISINES = [
+    "American",
+    "Burmese",
+    "Chinese",
+    "Ethiopian",
+    "Filipino",
+    "Indian",
+    "Italian",
+    "Japanese",
+    "Korean",
+    "Lebanese",
+    "Mexican",
+    "Middle Eastern",
+    "Pizza",
+    "Thai",
+    "Vietnamese",
+]
+AREAS = [
+    "Berkeley",
+    "Castro",
+    "Chinatown",
+    "Downtown Oakland",
+    "Fremont",
+    "Inner Richmond",
+    "Mission",
+    "Palo Alto",
+    "San Jose",
+    "SoMa",
+    "Sunset",
+    "Temescal",
+]
+ADJECTIVES = ["Golden", "Little", "Lucky", "Green", "Happy", "Blue", "Red", "Old"]
+NOUNS = ["Garden", "Kitchen", "Dragon", "Lotus", "Taqueria", "Bowl", "House", "Cafe"]
+DISHES = [
+    "mapo tofu",
+    "jackfruit tacos",
+    "mushroom ramen",
+    "chana masala",
+    "margherita pizza",
+    "tofu banh mi",
+    "falafel wrap",
+    "pad see ew",
+    "injera platter",
+    "bibimbap",
+]
+SENTENCES = [
+    "We came on a {day} and it was {busy}.",
+    "The {dish} was {verdict}, and the portion was {size}.",
+    "Service was {service} and the menu marks every vegan option clearly.",
+    "Would {again} order the {dish} again, it was {verdict}.",
+    "Prices are {price} for the area, especially for the {dish}.",
+    "The space is {space}, which suits {occasion}.",
+]
+WORDS = {
+    "day": ["Monday", "Wednesday", "Friday night", "Sunday morning"],
+    "busy": ["packed", "quiet", "just busy enough", "surprisingly empty"],
+    "verdict": ["excellent", "fine", "a bit bland", "unforgettable", "too salty"],
+    "size": ["huge", "generous", "a little small", "perfect"],
+    "service": ["quick", "friendly", "slow", "attentive"],
+    "again": ["definitely", "probably", "not"],
+    "price": ["fair", "steep", "a steal"],
+    "space": ["cozy", "loud", "bright", "cramped"],
+    "occasion": ["a date", "a quick lunch", "big groups", "takeout"],
+}
+
+
+def synthetic_review(i: int, rng: random.Random) -> str:
+    """Markdown for the i-th synthetic place, valid for the build and vilf lint"""
+    name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}"
+    taste = rng.choices(range(4), weights=[4, 3, 2, 1])[0]
+    visited = date(2019, 1, 1) + timedelta(days=rng.randrange(6 * 365))
+    dishes = rng.sample(DISHES, 3)
+    body = [f"Our visit number {i}."]
+    for _ in range(rng.randint(4, 10)):
+        words = {key: rng.choice(options) for key, options in WORDS.items()}
+        body.append(rng.choice(SENTENCES).format(dish=rng.choice(dishes), **words))
+    if taste >= 1:
+        body.append(f"Get the **{dishes[0]}**.")
+    # coordinates and phone numbers must be unique across places
+    lat = rng.uniform(*LAT_RANGE) + i * 1e-9
+    lon = rng.uniform(*LON_RANGE)
+    return f"""---
+name: {name}
+cuisine: {rng.choice(CUISINES)}
+address: {rng.randint(1, 9999)} {rng.choice(NOUNS)} St
+area: {rng.choice(AREAS)}
+lat: {lat}
+lon: {lon}
+phone: "+1415{i:07d}"
+menu: https://example.com/menus/{i}
+drinks: {rng.random() < 0.5}
+visited: "{visited.isoformat()}"
+taste: {taste}
+value: {rng.randrange(4)}
+instagram_published: False
+---
+
+{" ".join(body)}
+"""
+
+
+def synthetic_photo(n: int, size: tuple[int, int]) -> Image.Image:
+    """A photo-sized image with enough detail that JPEG encoding is not trivial"""
+    rng = random.Random(n)
+    im = Image.effect_noise(size, 48).convert("RGB")
+    draw = ImageDraw.Draw(im, "RGBA")
+    for _ in range(64):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        r = rng.randrange(size[1] // 16, size[1] // 3)
+        color = tuple(rng.randrange(256) for _ in range(3)) + (160,)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=color)
+    return im
+
+
+def generate_catalog(
+    workdir: Path,
+    places: int,
+    photo_ratio: float,
+    photo_size: tuple[int, int],
+    seed: int = 0,
+) -> int:
+    """
+    Lay out a buildable site in workdir with synthetic places and raw photos.
+
+    The templates are linked from the repo and the static assets copied,
+    without the generated images.
+
+    :return: the number of raw photos written
+    """
+    (workdir / "html").symlink_to(REPO_DIR / "html")
+    shutil.copy(REPO_DIR / "about.md", workdir / "about.md")
+    shutil.copytree(
+        REPO_DIR / "static", workdir / "static", ignore=shutil.ignore_patterns("img")
+    )
+    places_dir = workdir / "places"
+    places_dir.mkdir()
+    raw_dir = workdir / RAW_DIR
+    raw_dir.mkdir(parents=True)
+
+    photos = []
+    for n in range(PHOTO_VARIETY):
+        photo = raw_dir.parent / f"synthetic-{n}.jpg"
+        synthetic_photo(n, photo_size).save(photo, quality=90)
+        photos.append(photo)
+
+    rng = random.Random(seed)
+    photo_count = 0
+    for i in range(places):
+        slug = f"synthetic-place-{i:06d}"
+        (places_dir / f"{slug}.md").write_text(synthetic_review(i, rng))
+        if rng.random() < photo_ratio:
+            shutil.copyfile(photos[i % PHOTO_VARIETY], raw_dir / f"{slug}.jpg")
+            photo_count += 1
+    return photo_count
+
+
+def run_build(workdir: Path, jobs: int, trace: Path) -> dict:
+    """
+    Build workdir in a fresh interpreter and return its timings and peak RSS.
+
+    The peak RSS is the largest of the build process and its worker processes.
+    """
+    env = dict(os.environ, PYTHONPATH=str(REPO_DIR))
+    command = [sys.executable, "-m", "scripts.cli", "build", f"--jobs={jobs}"]
+    # a file rather than a pipe, which the build's progress bars could fill up
+    with tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            command + [f"--trace={trace}"],
+            cwd=workdir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=stderr,
+        )
+        # wait4 reports the build process together with the workers it reaped
+        _, status, rusage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise click.ClickException(
+                f"build failed in {workdir}:\n{stderr.read().decode()}"
+            )
+
+    with open(trace) as f:
+        events = json.load(f)["traceEvents"]
+    stages = {
+        event["name"]: {"wall_s": event["dur"] / 1e6, **event["args"]}
+        for event in events
+        if event["cat"] == "stage"
+    }
+    return {
+        "wall_s": wall,
+        "cpu_s": rusage.ru_utime + rusage.ru_stime,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": rusage.ru_maxrss / 1024,
+        "stages": stages,
+    }
+
+
+def time_startup(workdir: Path, repeat: int) -> dict:
+    """
+    Time each of STARTUP_COMMANDS in workdir, each run in a fresh interpreter.
+
+    A first build fills the build caches, so builds are timed doing nothing,
+    which is mostly the cost of starting up.
+
+    :return: {command: {"min_s": ..., "median_s": ...}}
+    """
+    env = dict(os.environ, PYTHONPATH=str(REPO_DIR))
+
+    def run(args):
+        start = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-m", "scripts.cli", *args],
+            cwd=workdir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        if process.returncode != 0:
+            raise click.ClickException(
+                f"vilf {' '.join(args)} failed in {workdir}:\n"
+                + process.stderr.decode()
+            )
+        return time.perf_counter() - start
+
+    run(["build"])
+    timings = {}
+    for name, args in STARTUP_COMMANDS.items():
+        times = [run(args) for _ in range(repeat)]
+        timings[name] = {"min_s": min(times), "median_s": statistics.median(times)}
+    return timings
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option(
+    "--places",
+    "-n",
+    "sizes",
+    default=[1000, 10000, 100000],
+    multiple=True,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Catalog size to benchmark, can be repeated.",
+)
+@click.option(
+    "--photo-ratio",
+    default=0.75,
+    type=click.FloatRange(0, 1),
+    show_default=True,
+    help="Fraction of places with a raw food photo, 0 to time everything but images.",
+)
+@click.option(
+    "--photo-size",
+    default=(2016, 1512),
+    type=(int, int),
+    show_default=True,
+    help="Width and height of the synthetic raw photos.",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    default=os.cpu_count() or 1,
+    type=click.IntRange(min=1),
+    help="Worker processes for each build (defaults to the CPU count).",
+)
+@click.option(
+    "--results",
+    default=RESULTS_PATH,
+    type=click.Path(dir_okay=False, path_type=Path),
+    show_default=True,
+    help="JSON lines file each run's results are appended to.",
+)
+@click.option(
+    "--keep",
+    is_flag=True,
+    help="Keep the generated catalogs instead of deleting them.",
+)
+@click.option(
+    "--startup",
+    is_flag=True,
+    help="Time vilf --help and builds of an empty catalog instead.",
+)
+@click.option(
+    "--repeat",
+    default=10,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Runs of each command timed by --startup.",
+)
+def benchmark_vilf(
+    sizes: tuple[int],
+    photo_ratio: float,
+    photo_size: tuple[int, int],
+    jobs: int,
+    results: Path,
+    keep: bool,
+    startup: bool,
+    repeat: int,
+) -> None:
+    """
+    Benchmark builds of synthetic catalogs, or the CLI's startup
+
+    By default cold and no-op builds of catalogs of each size are timed. With
+    --startup, vilf --help and no-op builds of an empty catalog are timed
+    instead, which is what every CLI call pays before doing any work.
+    """
+    results.parent.mkdir(parents=True, exist_ok=True)
+    if startup:
+        benchmark_startup(results, keep, repeat)
+        return
+
+    for size in sizes:
+        workdir = Path(tempfile.mkdtemp(prefix=f"vilf-benchmark-{size}-"))
+        try:
+            click.echo(f"Generating {size} places in {workdir}")
+            start = time.perf_counter()
+            photos = generate_catalog(workdir, size, photo_ratio, photo_size)
+            generate_s = time.perf_counter() - start
+
+            click.echo(f"Building {size} places and {photos} photos from scratch")
+            cold = run_build(workdir, jobs, workdir / "trace-cold.json")
+            click.echo("Building again with nothing changed")
+            noop = run_build(workdir, jobs, workdir / "trace-noop.json")
+        finally:
+            if not keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        result = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "jobs": jobs,
+            "places": size,
+            "photos": photos,
+            "photo_size": list(photo_size),
+            "generate_s": generate_s,
+            "cold": cold,
+            "noop": noop,
+            "places_per_s": size / cold["stages"]["place pages: render"]["wall_s"],
+            "photos_per_s": (
+                photos / cold["stages"]["images"]["wall_s"] if photos else None
+            ),
+        }
+        with open(results, "a") as o:
+            o.write(json.dumps(result) + "\n")
+        click.echo(
+            f"{size} places: cold build {cold['wall_s']:.1f}s "
+            f"({result['places_per_s']:.0f} place pages/s, {photos} photos), "
+            f"no-op build {noop['wall_s']:.1f}s, peak RSS {cold['peak_rss_mb']:.0f}MB"
+        )
+    click.echo(f"Appended results to {results}")
+
+
+def benchmark_startup(results: Path, keep: bool, repeat: int) -> None:
+    workdir = Path(tempfile.mkdtemp(prefix="vilf-benchmark-startup-"))
+    try:
+        generate_catalog(workdir, 0, 0, (64, 48))
+        click.echo(f"Timing {repeat} runs of each command in {workdir}")
+        timings = time_startup(workdir, repeat)
+    finally:
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "startup": timings,
+    }
+    with open(results, "a") as o:
+        o.write(json.dumps(result) + "\n")
+    for name, args in STARTUP_COMMANDS.items():
+        click.echo(
+            f"vilf {' '.join(args)}: median {timings[name]['median_s'] * 1000:.0f}ms, "
+            f"min {timings[name]['min_s'] * 1000:.0f}ms"
+        )
+    click.echo(f"Appended results to {results}")
@@ -1,98 +1,235 @@
 #!/bin/python3
 
+import hashlib
 import json
 import os
 import re
-import shutil
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date
+from functools import partial
 from pathlib import Path
+from typing import Optional
 
 import click
 import yaml
-from jinja2 import Environment, FileSystemLoader
 from markdown2 import markdown
-from mdplain import plain
-from PIL import Image
-from tqdm import tqdm
 
-SITE_URL = "https://vilf.org"
+from .assets import ASSET_MANIFEST_NAME, FINGERPRINT_DIRS, AssetManifest
+from .compress import precompress_tree
+from .geojson import GEOJSON_ENCODINGS, GEOJSON_PRECISION, encode_places
+from .graph import BuildGraph, template_sources
+from .images import (
+    build_thumb_atlases,
+    food_image_srcsets,
+    process_food_images,
+)
+from .listings import encode_feed, paginate
+from .minify import minify_html
+from .nearby import nearby_context, nearby_places
+from .places import (
+    UNIQUE_FIELDS,
+    Place,
+    PlaceCache,
+    PlaceIndex,
+    cuisine_slug,
+    load_place,
+    render_place_page,
+)
+from .profiling import Profiler
+from .search import SEARCH_FIELDS, SEARCH_PREFIX_LENGTH, build_search_index
+from .sync import prune_tree, sync_tree, write_if_changed
+from .templates import SITE_URL, make_environment
+from .tiles import TILE_ZOOM, tile_places
+
+# every output also depends on the code that generates it
+BUILD_CODE = [
+    Path(__file__).with_name(name)
+    for name in [
+        "build.py",
+        "geojson.py",
+        "listings.py",
+        "minify.py",
+        "nearby.py",
+        "places.py",
+        "search.py",
+        "templates.py",
+        "tiles.py",
+    ]
+]
 
 
 @click.command()
-def build_vilf() -> None:
+@click.option(
+    "--jobs",
+    "-j",
+    default=os.cpu_count() or 1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes for image processing and page rendering "
+    "(defaults to the CPU count).",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Print the wall and CPU time of each build stage and its slowest items.",
+)
+@click.option(
+    "--trace",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Write a Chrome trace of the build stages and items to this file "
+    "(implies --profile).",
+)
+@click.option(
+    "--minify",
+    is_flag=True,
+    help="Collapse whitespace and strip comments from every rendered page.",
+)
+@click.option(
+    "--geojson",
+    "geojson_encoding",
+    default="plain",
+    type=click.Choice(GEOJSON_ENCODINGS),
+    show_default=True,
+    help="Encoding of places.geojson: as is, compact (rounded coordinates, no "
+    "whitespace) or dictionary (compact with repeated properties dictionary "
+    "encoded, expanded by the map page).",
+)
+@click.option(
+    "--geojson-precision",
+    default=GEOJSON_PRECISION,
+    type=click.IntRange(min=0),
+    show_default=True,
+    help="Decimals kept of each coordinate in the compact geojson encodings.",
+)
+@click.option(
+    "--geojson-nearby",
+    "geojson_nearby_places",
+    is_flag=True,
+    help="Add the slugs of the places nearby each place to places.geojson.",
+)
+@click.option(
+    "--tiles",
+    is_flag=True,
+    help="Also split the places into z/x/y geojson tiles and have the map page "
+    "fetch only the tiles in view.",
+)
+def build_vilf(
+    jobs: int,
+    profile: bool,
+    trace: Optional[Path],
+    minify: bool,
+    geojson_encoding: str,
+    geojson_precision: int,
+    geojson_nearby_places: bool,
+    tiles: bool,
+) -> None:
     """Build VILF locally."""
+    build(
+        jobs,
+        profile=profile,
+        trace=trace,
+        minify=minify,
+        geojson_encoding=geojson_encoding,
+        geojson_precision=geojson_precision,
+        geojson_nearby_places=geojson_nearby_places,
+        tiles=tiles,
+    )
+
+
+def build(
+    jobs: int = os.cpu_count() or 1,
+    profile: bool = False,
+    trace: Optional[Path] = None,
+    minify: bool = False,
+    geojson_encoding: str = "plain",
+    geojson_precision: int = GEOJSON_PRECISION,
+    geojson_nearby_places: bool = False,
+    tiles: bool = False,
+) -> None:
+    """
+    Build the site into build/, reusing whatever is unchanged since the last build.
+
+    :param jobs: number of worker processes for image processing and page rendering
+    :param profile: print a per-stage timing summary at the end of the build
+    :param trace: also write the timings to this file as a Chrome trace
+    :param minify: minify the HTML of every page rendered
+    :param geojson_encoding: one of GEOJSON_ENCODINGS, see encode_places
+    :param geojson_precision: decimals kept of coordinates in compact encodings
+    :param geojson_nearby_places: list the places nearby each place in the geojson
+    :param tiles: also write the places as tiles for the map page to load
+    """
     print("Starting build of scripts...")
 
-    env = Environment(loader=FileSystemLoader("html"))
-    env.globals["SITE_URL"] = SITE_URL
+    profiler = Profiler(enabled=profile or trace is not None)
+    profiler.begin("setup")
+
+    env = make_environment()
 
     build_dir = Path("./build")
-    shutil.rmtree(build_dir, ignore_errors=True)
 
-    # scale, crop and store standardised images
-    food_image_target_size = (1920, 1080)
-    food_thumb_target_size = (426, 240)
-    jpg_quality = 75
+    # every file written to build_dir, anything else there is stale
+    outputs = set()
 
-    for img_type in ["food", "thumb"]:
-        path = Path(f"static/img/{img_type}")
-        if not os.path.exists(path):
-            os.makedirs(path)
+    def write_output(path, content):
+        write_if_changed(path, content)
+        outputs.add(path)
 
-    for raw_jpg in tqdm(
-        list(Path("raw/food").glob("*.jpg")), desc="processing food images"
-    ):
-        file_name = raw_jpg.parts[-1]
-        static_fp = Path("img/food") / file_name
-        thumb_fp = Path("img/thumb") / file_name
-        if not (
-            (Path("static") / static_fp).exists() & (Path("static") / thumb_fp).exists()
-        ):
-            with Image.open(raw_jpg) as im:
-                assert im.size[0] / im.size[1] <= 16 / 9
-                im = im.convert("RGB")
-                im = im.resize(
-                    (
-                        food_image_target_size[0],
-                        int(food_image_target_size[0] * im.size[1] / im.size[0]),
-                    )
-                )
-                pixels_to_crop = int((im.size[1] - food_image_target_size[1]) / 2)
-                (left, upper, right, lower) = (
-                    0,
-                    pixels_to_crop,
-                    food_image_target_size[0],
-                    food_image_target_size[1] + pixels_to_crop,
-                )
-                im_cropped = im.crop((left, upper, right, lower))
-                im_cropped.save(
-                    fp=Path("static") / static_fp, format="JPEG", quality=jpg_quality
-                )
+    graph = BuildGraph()
 
-                # thumbnails for images on map
-                im_thumb = im_cropped.resize(
-                    (food_thumb_target_size[0], food_thumb_target_size[1])
-                )
-                im_thumb.save(
-                    fp=Path("static") / thumb_fp, format="JPEG", quality=jpg_quality
-                )
+    # template name -> [pages, bytes before, bytes after] of the pages minified
+    minified = {}
 
-    shutil.copytree(Path("static"), build_dir)
+    def record_minified(template_name, sizes):
+        if sizes is not None:
+            totals = minified.setdefault(template_name, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += sizes[0]
+            totals[2] += sizes[1]
 
-    sitemap = []
+    def finish_page(template_name, html):
+        if not minify or not template_name.endswith(".html"):
+            return html
+        small = minify_html(html)
+        record_minified(template_name, (len(html.encode()), len(small.encode())))
+        return small
 
-    # map page
-    with open(build_dir / "index.html", "w") as o:
-        o.write(
-            env.get_template("map.html").render(
-                title="Vegans In Love with Food",
-                description="Find tasty vegan food in the San Francisco Bay Area with V.I.L.F!",
-                thumbnails=[
-                    str(Path(*file.parts[1:]))
-                    for file in Path("static/img/thumb").iterdir()
-                ],
-            )
+    def render_page(path, template_name, **context):
+        """Render a template to path unless its templates and context are unchanged"""
+        key = graph.key(
+            template_sources(env, template_name) + BUILD_CODE, [context, minify]
         )
+        if graph.lookup(path, key) is None:
+            html = env.get_template(template_name).render(**context)
+            write_output(path, finish_page(template_name, html))
+            graph.record(path, key)
+        outputs.add(path)
+
+    image_manifest = process_food_images(jobs, profiler)
+    profiler.begin("thumbnail atlases")
+    thumb_atlas = build_thumb_atlases(image_manifest)
+
+    profiler.begin("sync static")
+    # images are published under content-hashed names, links go through assets.url
+    assets = AssetManifest()
+
+    def publish_path(path):
+        if path.parts[0] in FINGERPRINT_DIRS:
+            return assets.add(path, graph.file_digest(Path("static") / path))
+        return path
+
+    outputs |= sync_tree(Path("static"), build_dir, publish_path)
+
+    def write_asset(path, content):
+        """Write generated content under its fingerprinted path, return its URL"""
+        path = assets.add(path, hashlib.sha256(content.encode()).hexdigest())
+        write_output(build_dir / path, content)
+        return f"/{path}"
+
+    srcsets = food_image_srcsets(image_manifest, assets.url)
+
+    profiler.begin("static pages")
+    sitemap = []
+
+    # the map page is rendered once places.geojson is written
     sitemap.append(
         {
             "url": f"{SITE_URL}/",
@@ -100,28 +237,36 @@ def build_vilf() -> None:
     )
 
     # error page
-    with open(build_dir / "error.html", "w") as o:
-        o.write(
-            env.get_template("error.html").render(
-                title="Vegans In Love with Food",
-                description="An error occured.",
-            )
-        )
+    render_page(
+        build_dir / "error.html",
+        "error.html",
+        title="Vegans In Love with Food",
+        description="An error occured.",
+    )
 
     # about page
     about_dir = build_dir / "about"
     about_dir.mkdir(exist_ok=True, parents=True)
-    with open(Path("about.md")) as f:
-        _, frontmatter, md = f.read().split("---", 2)
-    meta = yaml.load(frontmatter, Loader=yaml.Loader)
-    html = markdown(md.strip())
-    with open(about_dir / "index.html", "w") as o:
-        o.write(
-            env.get_template("about.html").render(
-                **meta,
-                content=html,
-            )
+    about_key = graph.key(
+        template_sources(env, "about.html") + BUILD_CODE + [Path("about.md")], minify
+    )
+    if graph.lookup(about_dir / "index.html", about_key) is None:
+        with open(Path("about.md")) as f:
+            _, frontmatter, md = f.read().split("---", 2)
+        meta = yaml.load(frontmatter, Loader=yaml.Loader)
+        html = markdown(md.strip())
+        write_output(
+            about_dir / "index.html",
+            finish_page(
+                "about.html",
+                env.get_template("about.html").render(
+                    **meta,
+                    content=html,
+                ),
+            ),
         )
+        graph.record(about_dir / "index.html", about_key)
+    outputs.add(about_dir / "index.html")
     sitemap.append(
         {
             "url": f"{SITE_URL}/about/",
@@ -129,253 +274,284 @@ def build_vilf() -> None:
     )
 
     # place pages
-    place_template = env.get_template("place.html")
+    profiler.begin("place reviews: check")
     places = []
 
-    taste_labels = ["DNR", "SGFI", "Good", "Phenomenal"]
-    value_labels = ["Bad", "Fine", "Good", "Phenomenal"]
-    rating_colors = ["#ef422b", "#efa72b", "#32af2d", "#2b9aef"]
-    faded_color = "#cecece"
-
-    def rating_to_formatting(rating, rating_labels):
-        return rating_labels[rating], rating_colors[rating]
-
-    def rating_html(rating, rating_labels):
-        return "&nbsp;".join(
-            [
-                f'<span style="color: {color if rating == ix else faded_color}" aria-hidden="{"false" if rating == ix else "true"}">{label}</span>'
-                for ix, (label, color) in enumerate(zip(rating_labels, rating_colors))
-            ]
-        )
-
-    boolean_labels = ["Nah", "Yeah"]
-    boolean_colors = ["#ef422b", "#2b9aef"]
-
-    def boolean_to_formatting(boolean):
-        return boolean_labels[boolean], boolean_colors[boolean]
-
-    def boolean_html(boolean):
-        return " ".join(
-            [
-                f'<span style="color: {color if boolean == ix else faded_color}" aria-hidden="{"false" if boolean == ix else "true"}">{label}</span>'
-                for ix, (label, color) in enumerate(zip(boolean_labels, boolean_colors))
-            ]
-        )
-
-    def format_title(meta):
-        return f'{meta["name"]} — Tasty vegan food in {meta["area"]}, in the San Francisco Bay Area — Vegans In Love with Food'
-
-    def format_description(meta):
-        return f'Read our review on {meta["name"]} at {meta["address"]} in {meta["area"]}, and more tasty vegan {meta["cuisine"]} food in the San Francisco Bay Area from V.I.L.F!'
-
-    def format_phone_number(meta):
-        if meta["phone"] is None:
-            return
-        number = meta["phone"]
-        assert len(number) == 12, meta["slug"]
-        assert number[:2] == "+1", meta["slug"]
-        return f"({number[2:5]}) {number[5:8]}-{number[8:12]}"
-
-    assert format_phone_number({"phone": "+12345678987"}) == "(234) 567-8987"
-
-    def format_geodata(meta):
-        return f'{meta["lat"]},{meta["lon"]}'
-
-    def suffix(d):
-        return "th" if 11 <= d <= 13 else {1: "st", 2: "nd", 3: "rd"}.get(d % 10, "th")
-
-    def custom_strftime(format_, t):
-        return t.strftime(format_).replace("{S}", str(t.day) + suffix(t.day))
-
-    def format_visited(visited):
-        return custom_strftime("{S} %B %Y", visited)
-
-    def format_blurb(md):
-        return " ".join(plain(re.sub(r"\s+", " ", md.strip())).split(" ")[:50]) + "..."
-
     def get_fp_food_image(slug):
-        static_fp = Path(f"img/food/{slug}.jpg")
-        return (
-            str(Path(f"/{static_fp}"))
-            if (Path("static") / static_fp).exists()
-            else None
-        )
+        url = f"/img/food/{slug}.jpg"
+        return assets.url(url) if url in assets else None
 
     def get_fp_food_thumb(slug):
-        static_fp = Path(f"img/thumb/{slug}.jpg")
-        return (
-            str(Path(f"/{static_fp}"))
-            if (Path("static") / static_fp).exists()
-            else None
-        )
+        url = f"/img/thumb/{slug}.jpg"
+        return assets.url(url) if url in assets else None
+
+    place_sources = template_sources(env, "place.html") + BUILD_CODE
+
+    def map_places(stage, fn, labels, *iterables):
+        """Map fn over reviews, in worker processes if there are enough of them"""
+        if jobs == 1 or len(labels) <= 1:
+            return list(profiler.map(stage, fn, labels, *iterables))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            return list(
+                profiler.map(
+                    stage,
+                    fn,
+                    labels,
+                    *iterables,
+                    mapper=partial(executor.map, chunksize=8),
+                )
+            )
 
-    for place_md in Path("places").glob("*.md"):
+    # take the place of an unchanged review from its page's last build and queue
+    # the rest for parsing. Pages are only rendered once every place is known,
+    # since each page lists the places nearby
+    place_results = {}
+    place_inputs = {}
+    tasks = []
+    for place_md in sorted(Path("places").glob("*.md")):
         try:
             slug = place_md.parts[-1][:-3]
             assert re.match(r"^[0-9a-z-]+$", slug), "Bad filename for " + str(place_md)
-            relative_url = f"/places/{slug}/"
-            with open(place_md) as f:
-                _, frontmatter, md = f.read().split("---", 2)
-            meta = yaml.load(frontmatter, Loader=yaml.Loader)
-            meta["url"] = relative_url
-            meta["slug"] = slug
-            meta["geodata"] = format_geodata(meta)
-            meta["phone_display"] = format_phone_number(meta)
-            visited = date.fromisoformat(meta["visited"])
-            meta["visited_display"] = format_visited(visited)
-            meta["review_age"] = (date.today() - visited).days
-            if meta["taste"] >= 1:
-                assert "**" in md, f"highlight food in {meta['slug']}"
-            meta["taste_label"], meta["taste_color"] = rating_to_formatting(
-                meta["taste"], taste_labels
-            )
-            meta["value_label"], meta["value_color"] = rating_to_formatting(
-                meta["value"], value_labels
-            )
-            meta["drinks_label"], meta["drinks_color"] = boolean_to_formatting(
-                meta["drinks"]
-            )
-            html = markdown(md.strip())
-            meta["blurb"] = format_blurb(md)
-            meta["food_image_path"] = get_fp_food_image(slug)
-            meta["food_thumb_path"] = get_fp_food_thumb(slug)
-            rendered = place_template.render(
-                **meta,
-                title=format_title(meta),
-                description=format_description(meta),
-                taste_html=rating_html(meta["taste"], taste_labels),
-                value_html=rating_html(meta["value"], value_labels),
-                drinks_html=boolean_html(meta["drinks"]),
-                content=html,
-            )
-            out_dir = build_dir / "places" / slug
-            out_dir.mkdir(exist_ok=True, parents=True)
-            with open(out_dir / "index.html", "w") as o:
-                o.write(rendered)
-            places.append(meta)
-
-            sitemap.append(
-                {
-                    "url": f"{SITE_URL}{relative_url}",
-                    "lastmod": visited,
-                }
-            )
+            out_path = build_dir / "places" / slug / "index.html"
+            images = {
+                "food_image_path": get_fp_food_image(slug),
+                "food_thumb_path": get_fp_food_thumb(slug),
+                "food_image_srcset": srcsets.get(slug),
+            }
+            source_key = graph.key(place_sources + [place_md], [images, minify])
+            place_inputs[place_md] = (images, out_path, source_key)
+            entry = graph.recorded(out_path)
+            if entry is not None and entry["data"].get("source") == source_key:
+                place_results[place_md] = (
+                    Place.from_record(entry["data"]["place"]),
+                    None,
+                )
+            else:
+                tasks.append(place_md)
         except Exception as e:
-            print(place_md.name, e)
+            place_results[place_md] = (None, str(e))
+
+    profiler.begin("place reviews: parse").count = len(tasks)
+    loaded = map_places(
+        "place reviews",
+        load_place,
+        [place_md.name for place_md in tasks],
+        tasks,
+        [place_inputs[place_md][0] for place_md in tasks],
+    )
+    place_results.update(zip(tasks, loaded))
 
-    unique_fields = ["name", "lat", "lon", "menu", "phone", "blurb"]
+    profiler.begin("place index")
+    PlaceCache().prune()
 
-    for field in unique_fields:
-        field_list = [place[field] for place in places if place[field] is not None]
-        assert len(set(field_list)) == len(field_list), f"Reused {field} field"
+    for place_md in sorted(place_results):
+        place, error = place_results[place_md]
+        if error is not None:
+            print(place_md.name, error)
+            continue
+        places.append(place)
 
-    geojson_keys = [
-        "name",
-        "cuisine",
-        "url",
-        "taste_color",
-        "taste_label",
-        "value_color",
-        "value_label",
-        "food_thumb_path",
-        "food_image_path",
-    ]
-
-    geojson = {
-        "type": "FeatureCollection",
-        "features": [
+        sitemap.append(
             {
-                "type": "Feature",
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [place["lon"], place["lat"]],
-                },
-                "properties": {
-                    key: value for key, value in place.items() if key in geojson_keys
-                },
+                "url": f"{SITE_URL}{place.url}",
+                "lastmod": place.visited,
             }
-            # sort reverse of by taste desc, then value desc, then alphabetical by name
-            for place in sorted(
-                places,
-                key=lambda item: (-item["taste"], -item["value"], item["slug"]),
-                reverse=True,
-            )
-        ],
-    }
+        )
 
-    with open(build_dir / "places.geojson", "w") as o:
-        o.write(json.dumps(geojson))
-
-    # best page
-    best_dir = build_dir / "best"
-    best_dir.mkdir(exist_ok=True, parents=True)
-    with open(best_dir / "index.html", "w") as o:
-        o.write(
-            env.get_template("best.html").render(
-                title="Vegans In Love with Food",
-                description="Find tasty vegan food around the San Francisco Bay Area with V.I.L.F!",
-                # sort by taste desc, then value desc, then alphabetical by name
-                places=sorted(
-                    places,
-                    key=lambda item: (-item["taste"], -item["value"], item["slug"]),
-                ),
-            )
+    for field in UNIQUE_FIELDS:
+        field_list = [
+            getattr(place, field)
+            for place in places
+            if getattr(place, field) is not None
+        ]
+        assert len(set(field_list)) == len(field_list), f"Reused {field} field"
+
+    index = PlaceIndex(places)
+
+    profiler.begin("nearby places").count = len(places)
+    nearby = nearby_places(index.best)
+
+    # reuse place pages whose review and nearby places are unchanged, and render
+    # the rest
+    profiler.begin("place pages: check")
+    tasks = []
+    for place_md in sorted(place_results):
+        place, _ = place_results[place_md]
+        if place is None:
+            continue
+        images, out_path, source_key = place_inputs[place_md]
+        place_nearby = nearby_context(nearby[place.slug])
+        page_key = graph.key([], [source_key, place_nearby])
+        if graph.lookup(out_path, page_key) is not None:
+            outputs.add(out_path)
+        else:
+            tasks.append((place_md, images, out_path, place_nearby, page_key))
+
+    profiler.begin("place pages: render").count = len(tasks)
+    rendered = map_places(
+        "place pages",
+        render_place_page,
+        [place_md.name for place_md, *_ in tasks],
+        [place_md for place_md, *_ in tasks],
+        [images for _, images, *_ in tasks],
+        [out_path for _, _, out_path, *_ in tasks],
+        [minify] * len(tasks),
+        [place_nearby for *_, place_nearby, _ in tasks],
+    )
+    for (place_md, _, out_path, _, page_key), (place, error, sizes) in zip(
+        tasks, rendered
+    ):
+        if error is not None:
+            print(place_md.name, error)
+            continue
+        record_minified("place.html", sizes)
+        outputs.add(out_path)
+        graph.record(
+            out_path,
+            page_key,
+            data={"source": place_inputs[place_md][2], "place": place.to_record()},
         )
-    sitemap.insert(
-        2,
-        {
-            "url": f"{SITE_URL}/best/",
-            "changefreq": "daily",
+
+    profiler.begin("geojson").count = len(places)
+    geojson_nearby = None
+    if geojson_nearby_places:
+        geojson_nearby = {
+            slug: [place.slug for place, _ in place_nearby]
+            for slug, place_nearby in nearby.items()
+        }
+    geojson = encode_places(
+        # reverse of by taste desc, then value desc, then alphabetical by name
+        reversed(index.best),
+        encoding=geojson_encoding,
+        precision=geojson_precision,
+        nearby=geojson_nearby,
+    )
+    write_asset(Path("places.geojson"), geojson)
+
+    # the same places split into tiles, for the map to fetch those in view
+    place_tiles = None
+    if tiles:
+        profiler.begin("tiles")
+        place_tiles = {"zoom": TILE_ZOOM, "tiles": {}}
+        for (x, y), ranked in tile_places(list(reversed(index.best))).items():
+            tile = encode_places(
+                [place for _, place in ranked],
+                encoding=geojson_encoding,
+                precision=geojson_precision,
+                ranks=[rank for rank, _ in ranked],
+                nearby=geojson_nearby,
+            )
+            place_tiles["tiles"][f"{x}/{y}"] = write_asset(
+                Path(f"tiles/{TILE_ZOOM}/{x}/{y}.geojson"), tile
+            )
+
+    # map page
+    render_page(
+        build_dir / "index.html",
+        "map.html",
+        title="Vegans In Love with Food",
+        description="Find tasty vegan food in the San Francisco Bay Area with V.I.L.F!",
+        geojson_url=assets.url("/places.geojson"),
+        geojson_dictionary=geojson_encoding == "dictionary",
+        place_tiles=place_tiles,
+        thumb_atlas={
+            "tile": thumb_atlas["tile"],
+            "atlases": [
+                {**atlas, "url": assets.url(atlas["url"])}
+                for atlas in thumb_atlas["atlases"]
+            ],
+            "thumbs": thumb_atlas["thumbs"],
         },
     )
 
-    # latest page
-    latest_dir = build_dir / "latest"
-    latest_dir.mkdir(exist_ok=True, parents=True)
-    with open(latest_dir / "index.html", "w") as o:
-        o.write(
-            env.get_template("latest.html").render(
-                title="Latest Reviews from Vegans In Love with Food",
-                description="Find tasty vegan food around the San Francisco Bay Area!",
-                # sort by age then standard
-                places=sorted(
-                    places,
-                    key=lambda item: (
-                        item["review_age"],
-                        -item["taste"],
-                        -item["value"],
-                        item["slug"],
-                    ),
-                ),
+    # search page, its index is fetched a shard at a time as queries need them
+    profiler.begin("search index").count = len(places)
+    search_index = {
+        "weights": list(SEARCH_FIELDS.values()),
+        "prefix_length": SEARCH_PREFIX_LENGTH,
+        "shards": {
+            prefix: write_asset(
+                Path(f"search/{prefix}.json"),
+                json.dumps(shard, separators=(",", ":"), ensure_ascii=False),
             )
-        )
-    sitemap.insert(
-        2,
-        {
-            "url": f"{SITE_URL}/latest/",
-            "changefreq": "daily",
+            for prefix, shard in build_search_index(index.best).items()
         },
+    }
+    search_dir = build_dir / "search"
+    search_dir.mkdir(exist_ok=True, parents=True)
+    render_page(
+        search_dir / "index.html",
+        "search.html",
+        title="Search Vegans In Love with Food",
+        description="Search our reviews of vegan food in the San Francisco Bay Area by name, dish, cuisine or neighborhood!",
+        search_index_url=write_asset(
+            Path("search/index.json"),
+            json.dumps(search_index, separators=(",", ":"), ensure_ascii=False),
+        ),
+    )
+    sitemap.append(
+        {
+            "url": f"{SITE_URL}/search/",
+        }
+    )
+    write_output(build_dir / ASSET_MANIFEST_NAME, assets.to_json())
+
+    def render_listing(base_url, template_name, places, title, **context):
+        """
+        Render places a fixed number per page, each page with its JSON feed.
+
+        :return: sitemap entries of the pages
+        """
+        entries = []
+        for page in paginate(places, base_url):
+            page_dir = build_dir / page.url.strip("/")
+            page_dir.mkdir(exist_ok=True, parents=True)
+            render_page(
+                page_dir / "index.html",
+                template_name,
+                title=title if page.number == 1 else f"{title} — Page {page.number}",
+                page=page,
+                **context,
+            )
+            write_output(build_dir / page.feed_url.lstrip("/"), encode_feed(page))
+            entries.append({"url": f"{SITE_URL}{page.url}", "changefreq": "daily"})
+        return entries
+
+    # best pages
+    profiler.begin("listing pages")
+    sitemap[2:2] = render_listing(
+        "/best/",
+        "best.html",
+        # sort by taste desc, then value desc, then alphabetical by name
+        index.best,
+        title="Vegans In Love with Food",
+        description="Find tasty vegan food around the San Francisco Bay Area with V.I.L.F!",
     )
 
-    cuisine_names = sorted(set([place["cuisine"] for place in places]))
+    # latest pages
+    sitemap[2:2] = render_listing(
+        "/latest/",
+        "latest.html",
+        # sort by age then standard
+        index.latest,
+        title="Latest Reviews from Vegans In Love with Food",
+        description="Find tasty vegan food around the San Francisco Bay Area!",
+    )
 
     cuisines_dir = build_dir / "cuisines"
     cuisines_dir.mkdir(exist_ok=True, parents=True)
-    with open(cuisines_dir / "index.html", "w") as o:
-        o.write(
-            env.get_template("cuisine-list.html").render(
-                cuisines=[
-                    {
-                        "name": cuisine,
-                        "url": f"/cuisines/{cuisine.lower().replace(' ','-')}/",
-                        "len": len(
-                            [place for place in places if place["cuisine"] == cuisine]
-                        ),
-                    }
-                    for cuisine in cuisine_names
-                ]
-            )
-        )
+    render_page(
+        cuisines_dir / "index.html",
+        "cuisine-list.html",
+        cuisines=[
+            {
+                "name": cuisine,
+                "url": f"/cuisines/{cuisine_slug(cuisine)}/",
+                "len": len(cuisine_places),
+            }
+            for cuisine, cuisine_places in index.by_cuisine.items()
+        ],
+    )
     sitemap.insert(
         2,
         {
@@ -390,50 +566,56 @@ def build_vilf() -> None:
     def format_cuisine_description(meta):
         return f"Read our reviews on vegan {cuisine} food and others in the Bay Area from V.I.L.F!"
 
-    cuisine_template = env.get_template("cuisine.html")
-
-    for cuisine in cuisine_names:
-        slug = cuisine.lower().replace(" ", "-")
-        cuisine_places = [
-            place["name"] for place in places if place["cuisine"] == cuisine
-        ]
-        rendered = cuisine_template.render(
+    for cuisine, cuisine_places in index.by_cuisine.items():
+        sitemap += render_listing(
+            f"/cuisines/{cuisine_slug(cuisine)}/",
+            "cuisine.html",
+            cuisine_places,
             title=format_cuisine_title(cuisine),
             description=format_cuisine_description(cuisine),
             cuisine=cuisine,
-            places=sorted(
-                [place for place in places if place["cuisine"] == cuisine],
-                key=lambda item: (-item["taste"], -item["value"], item["slug"]),
-            ),
-        )
-        cuisine_dir = build_dir / "cuisines" / slug
-        cuisine_dir.mkdir(exist_ok=True, parents=True)
-        with open(cuisine_dir / "index.html", "w") as o:
-            o.write(rendered)
-
-        sitemap.append(
-            {
-                "url": f"{SITE_URL}/cuisines/{slug}/",
-                "changefreq": "daily",
-            }
         )
 
-    with open(build_dir / "sitemap.xml", "w") as o:
-        o.write(
-            env.get_template("sitemap.xml").render(
-                urls=[
-                    (
-                        item.get("url"),
-                        item.get("lastmod", date.today()),
-                        item.get("changefreq"),
-                    )
-                    for item in sitemap
-                ]
+    profiler.begin("sitemap")
+    render_page(
+        build_dir / "sitemap.xml",
+        "sitemap.xml",
+        urls=[
+            (
+                item.get("url"),
+                item.get("lastmod", date.today()),
+                item.get("changefreq"),
             )
+            for item in sitemap
+        ],
+    )
+
+    write_output(build_dir / "robots.txt", "User-agent: *\nDisallow:\n")
+
+    for template_name, (pages, before, after) in sorted(minified.items()):
+        print(
+            f"Minified {pages} {template_name} page(s) from {before / 1024:.0f} KiB "
+            f"to {after / 1024:.0f} KiB, saving {(before - after) / 1024:.0f} KiB "
+            f"({(before - after) / before:.0%})"
         )
 
-    with open(build_dir / "robots.txt", "w") as o:
-        o.write("User-agent: *\nDisallow:\n")
+    profiler.begin("precompress")
+    outputs |= precompress_tree(outputs, jobs)
+
+    profiler.begin("save and prune")
+    graph.save()
+    print(f"Rendered {graph.rebuilt} page(s), reused {graph.reused} unchanged")
+
+    removed = prune_tree(build_dir, outputs)
+    if removed:
+        print(f"Removed {removed} stale file(s) from {build_dir}")
+    profiler.end()
+
+    if profiler.enabled:
+        print(profiler.summary())
+    if trace is not None:
+        profiler.write_trace(trace)
+        print(f"Wrote build trace to {trace}")
 
     print(f"Done building VILF with {len(places)} places")
 
@@ -445,17 +627,20 @@ def build_vilf() -> None:
 
     # Count the occurrences of each 'taste' value
     for place in places:
-        taste = place['taste']
+        taste = place.taste
         if taste in taste_counts:
             taste_counts[taste] += 1
 
-    # Calculate the total number of entries
+    # Calculate the total number of entries, an empty catalog has no breakdown
     total_entries = len(places)
+    if total_entries == 0:
+        return
 
     # Calculate and print the percentage for each 'taste' value in order
     for taste in sorted(taste_labels.keys()):
         percentage = round((taste_counts[taste] / total_entries) * 100)
         print(f"{taste_labels[taste]}: {percentage}%")
 
+
 if __name__ == "__main__":
     build()
@@ -1,11 +1,59 @@
+from importlib import import_module
+from typing import Optional
+
 import click
 
-from .build import build_vilf
-from .cross_reference import cross_reference_md
-from .spatula import scrape_and_gen_md
+# command name -> (module:function it is defined in, short help). Commands are
+# only imported when run, so e.g. vilf build never imports selenium for spatula
+COMMANDS = {
+    "build": ("build:build_vilf", "Build VILF locally."),
+    "serve": (
+        "serve:serve_vilf",
+        "Build VILF, serve it locally and rebuild whatever changed on every edit.",
+    ),
+    "spatula": (
+        "spatula:scrape_and_gen_md",
+        "Scrape Google Maps and generate a markdown file",
+    ),
+    "check": (
+        "cross_reference:cross_reference_md",
+        "Cross-reference the files against scraped Google Maps",
+    ),
+    "lint": (
+        "lint:lint_vilf",
+        "Check every review in places/ and photo in raw/food",
+    ),
+    "benchmark": (
+        "benchmark:benchmark_vilf",
+        "Benchmark builds of synthetic catalogs, or the CLI's startup",
+    ),
+    "stage": (
+        "compress:stage_vilf",
+        "Lay out BUILD_DIR in STAGE_DIR for upload to the bucket.",
+    ),
+}
+
+
+class LazyGroup(click.Group):
+    """A click group that imports each of its COMMANDS the first time it is used"""
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted(COMMANDS)
+
+    def get_command(self, ctx: click.Context, name: str) -> Optional[click.Command]:
+        if name not in COMMANDS:
+            return None
+        module, function = COMMANDS[name][0].split(":")
+        return getattr(import_module(f".{module}", __package__), function)
+
+    def format_commands(self, ctx: click.Context, formatter: click.HelpFormatter):
+        # from COMMANDS rather than the commands' docstrings, which would mean
+        # importing every command just to list them
+        with formatter.section("Commands"):
+            formatter.write_dl([(name, COMMANDS[name][1]) for name in sorted(COMMANDS)])
 
 
-@click.group()
+@click.group(cls=LazyGroup)
 def cli():
     """
     VILF CLI interface
@@ -14,7 +62,4 @@ def cli():
 
 
 if __name__ == "__main__":
-    cli.add_command(build_vilf, "build")
-    cli.add_command(scrape_and_gen_md, "spatula")
-    cli.add_command(cross_reference_md, "check")
     cli()
@@ -0,0 +1,111 @@
+"""
+Module to precompress the text files in build/ and lay them out for publishing
+"""
+import gzip
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import click
+
+from .assets import load_fingerprinted
+from .sync import prune_tree, sync_file
+
+TEXT_SUFFIXES = {".html", ".xml", ".json", ".geojson", ".txt", ".css", ".js", ".svg"}
+# sibling suffix -> compressor at its maximum level. Only gzip, as the bucket
+# serves a single encoding per object and cannot negotiate between siblings
+ENCODINGS = {".gz": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+
+
+def compressed_siblings(path: Path) -> list[Path]:
+    """e.g. build/index.html -> [build/index.html.gz]"""
+    return [path.with_name(path.name + suffix) for suffix in ENCODINGS]
+
+
+def is_compressed(path: Path) -> bool:
+    """Whether every sibling was compressed from path's current content"""
+    mtime = path.stat().st_mtime_ns
+    try:
+        return all(
+            sibling.stat().st_mtime_ns == mtime for sibling in compressed_siblings(path)
+        )
+    except FileNotFoundError:
+        return False
+
+
+def compress_file(path: Path) -> None:
+    """
+    Write every compressed sibling of path.
+
+    Siblings take path's mtime, so a later build can tell they are up to date
+    without decompressing them, since unchanged outputs are never rewritten.
+    """
+    data = path.read_bytes()
+    stat = path.stat()
+    for suffix, compress in ENCODINGS.items():
+        sibling = path.with_name(path.name + suffix)
+        # never write through a hardlink into a staged copy
+        sibling.unlink(missing_ok=True)
+        sibling.write_bytes(compress(data))
+        os.utime(sibling, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def precompress_tree(outputs: set[Path], jobs: int) -> set[Path]:
+    """
+    Compress every text file among outputs whose content changed since last time.
+
+    :return: the compressed siblings of all text outputs, changed or not
+    """
+    texts = sorted(path for path in outputs if path.suffix in TEXT_SUFFIXES)
+    todo = [path for path in texts if not is_compressed(path)]
+    if jobs == 1 or len(todo) <= 1:
+        list(map(compress_file, todo))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(compress_file, todo, chunksize=16))
+    print(
+        f"Compressed {len(todo)} of {len(texts)} text files "
+        f"({', '.join(ENCODINGS)})"
+    )
+    return {sibling for path in texts for sibling in compressed_siblings(path)}
+
+
+@click.command()
+@click.argument(
+    "build_dir", default="build", type=click.Path(file_okay=False, path_type=Path)
+)
+@click.argument(
+    "stage_dir", default="publish", type=click.Path(file_okay=False, path_type=Path)
+)
+def stage_vilf(build_dir: Path, stage_dir: Path) -> None:
+    """
+    Lay out BUILD_DIR in STAGE_DIR for upload to the bucket.
+
+    Text files go to STAGE_DIR/gzip as their gzip sibling under the original
+    name, to be uploaded with Content-Encoding: gzip. Everything else goes to
+    STAGE_DIR/plain as is. Fingerprinted assets go to the -immutable variant of
+    either directory instead, to be uploaded with a year long Cache-Control.
+    Files are hardlinked where possible.
+    """
+    fingerprinted = load_fingerprinted(build_dir)
+    staged = set()
+    for root, _, files in os.walk(build_dir):
+        for name in files:
+            path = Path(root) / name
+            if path.suffix in ENCODINGS:
+                continue
+            if path.suffix in TEXT_SUFFIXES:
+                src = path.with_name(name + ".gz")
+                if not src.exists():
+                    raise click.ClickException(f"{path} has not been precompressed")
+                encoding = "gzip"
+            else:
+                src = path
+                encoding = "plain"
+            if path in fingerprinted:
+                encoding += "-immutable"
+            dst = stage_dir / encoding / path.relative_to(build_dir)
+            sync_file(src, dst)
+            staged.add(dst)
+    prune_tree(stage_dir, staged)
+    print(f"Staged {len(staged)} files from {build_dir} in {stage_dir}")
@@ -0,0 +1,82 @@
+"""
+Module to encode the places shown on the map as places.geojson
+"""
+import json
+from typing import Iterable, Optional
+
+from .places import Place
+
+GEOJSON_ENCODINGS = ["plain", "compact", "dictionary"]
+# decimals kept of each coordinate in the compact encodings, 5 is about a meter
+GEOJSON_PRECISION = 5
+# coded property -> the properties each of its dictionary entries expands to
+DICTIONARY_PROPERTIES = {
+    "taste": ["taste_label", "taste_color"],
+    "value": ["value_label", "value_color"],
+    "cuisine": ["cuisine"],
+}
+
+
+def _dictionary_encode(features: list[dict]) -> dict:
+    """
+    Replace repeated property values with indices into per-property tables.
+
+    The url is dropped too, since map.html derives it from the slug.
+    e.g. {"taste_label": "Good", "taste_color": "#32af2d", ...}
+      -> {"taste": 2, ...} with dictionary["taste"]["values"][2] == ["Good", "#32af2d"]
+    """
+    dictionary = {}
+    for coded, keys in DICTIONARY_PROPERTIES.items():
+        values = sorted(
+            {tuple(feature["properties"][key] for key in keys) for feature in features}
+        )
+        indices = {value: i for i, value in enumerate(values)}
+        for feature in features:
+            properties = feature["properties"]
+            value = tuple(properties.pop(key) for key in keys)
+            properties[coded] = indices[value]
+        dictionary[coded] = {"keys": keys, "values": [list(value) for value in values]}
+    for feature in features:
+        del feature["properties"]["url"]
+    return dictionary
+
+
+def encode_places(
+    places: Iterable[Place],
+    encoding: str = "plain",
+    precision: int = GEOJSON_PRECISION,
+    ranks: Optional[Iterable[int]] = None,
+    nearby: Optional[dict[str, list[str]]] = None,
+) -> str:
+    """
+    Serialise places as a GeoJSON FeatureCollection.
+
+    plain: every property of Place.to_geojson_feature, full precision coordinates
+    compact: the same properties with rounded coordinates and no whitespace
+    dictionary: compact, with the properties in DICTIONARY_PROPERTIES replaced by
+                indices into a top level "dictionary" that map.html expands
+
+    :param ranks: added to each feature as a "rank" property if given
+    :param nearby: slugs of the places nearby each place by slug, added to each
+                   feature as a "nearby" property if given
+    """
+    features = [place.to_geojson_feature() for place in places]
+    if ranks is not None:
+        for feature, rank in zip(features, ranks, strict=True):
+            feature["properties"]["rank"] = rank
+    if nearby is not None:
+        for feature in features:
+            feature["properties"]["nearby"] = nearby[feature["properties"]["slug"]]
+    if encoding == "plain":
+        return json.dumps({"type": "FeatureCollection", "features": features})
+
+    for feature in features:
+        coordinates = feature["geometry"]["coordinates"]
+        feature["geometry"]["coordinates"] = [
+            round(coordinate, precision) for coordinate in coordinates
+        ]
+    geojson = {"type": "FeatureCollection"}
+    if encoding == "dictionary":
+        geojson["dictionary"] = _dictionary_encode(features)
+    geojson["features"] = features
+    return json.dumps(geojson, separators=(",", ":"), ensure_ascii=False)
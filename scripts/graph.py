@@ -0,0 +1,120 @@
+"""
+Module to track which inputs every build output came from, so unchanged outputs are skipped
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from jinja2 import Environment, meta
+
+GRAPH_PATH = Path(".cache/build-graph.json")
+
+
+def template_sources(env: Environment, name: str) -> list[Path]:
+    """
+    Return the files a template is rendered from, following extends/include/import.
+
+    e.g. place.html -> [html/base.html, html/place.html]
+    """
+    seen = {}
+    stack = [name]
+    while stack:
+        current = stack.pop()
+        if current in seen:
+            continue
+        source, filename, _ = env.loader.get_source(env, current)
+        seen[current] = Path(filename)
+        stack.extend(
+            ref
+            for ref in meta.find_referenced_templates(env.parse(source))
+            if ref is not None
+        )
+    return sorted(seen.values())
+
+
+class BuildGraph:
+    """
+    Persisted record of the inputs each build output was generated from.
+
+    An output's key digests the contents of its input files (markdown, templates,
+    the build code) together with any other data its rendering depends on. If the
+    key matches the one recorded by the previous build and the output still
+    exists, the output can be reused without rendering it again.
+
+    Entries can carry JSON data alongside the key (e.g. the place metadata the
+    listing pages need), so a skipped output does not have to be re-parsed.
+    """
+
+    def __init__(self, path: Path = GRAPH_PATH):
+        self.path = path
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        # path -> [size, mtime_ns, sha256] of every input seen
+        self._files = data.get("files", {})
+        # output path -> {"key": digest, "data": ...}
+        self._outputs = data.get("outputs", {})
+        self._seen_files = {}
+        self._seen_outputs = {}
+        self.rebuilt = 0
+        self.reused = 0
+
+    def file_digest(self, path: Path) -> str:
+        """SHA-256 of a file, only re-read when its size or mtime moved"""
+        name = str(path)
+        if name in self._seen_files:
+            return self._seen_files[name][2]
+        stat = path.stat()
+        cached = self._files.get(name)
+        if cached and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            digest = cached[2]
+        else:
+            digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        self._seen_files[name] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def key(self, inputs: Iterable[Path], context: Any = None) -> str:
+        """Digest the given input files and JSON-serialisable context"""
+        digest = hashlib.sha256()
+        for path in inputs:
+            digest.update(f"{path}\0{self.file_digest(path)}\0".encode())
+        digest.update(json.dumps(context, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def lookup(self, output: Path, key: str) -> Optional[dict]:
+        """
+        Return the recorded entry for output if it is still fresh, otherwise None.
+
+        Fresh entries are carried over to the next saved graph.
+        """
+        entry = self._outputs.get(str(output))
+        if entry is None or entry["key"] != key or not output.exists():
+            return None
+        self._seen_outputs[str(output)] = entry
+        self.reused += 1
+        return entry
+
+    def recorded(self, output: Path) -> Optional[dict]:
+        """The entry the previous build recorded for output, whether fresh or not"""
+        return self._outputs.get(str(output))
+
+    def record(self, output: Path, key: str, data: Any = None) -> None:
+        """Record that output was just generated from the inputs behind key"""
+        self._seen_outputs[str(output)] = {"key": key, "data": data}
+        self.rebuilt += 1
+
+    def save(self) -> None:
+        """Persist the entries looked up or recorded during this build only"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as o:
+            json.dump(
+                {"files": self._seen_files, "outputs": self._seen_outputs},
+                o,
+                default=str,
+            )
+        os.replace(tmp_path, self.path)
@@ -5,6 +5,8 @@ from PIL import Image, ImageDraw, ImageFont
 
 
 class ImageGenerator:
+    """Draws the social card of a place, given as Place.to_social_card()"""
+
     def __init__(
         self, place, font_path="comic_sans.ttf", logo_font_path="emilyscandy.ttf"
     ):
@@ -0,0 +1,423 @@
+"""
+Module to scale, crop and store the standardised food images and thumbnails
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Optional
+
+import click
+from PIL import Image, features
+from tqdm import tqdm
+
+from .profiling import Profiler
+
+RAW_DIR = Path("raw/food")
+STATIC_DIR = Path("static")
+
+FOOD_IMAGE_TARGET_SIZE = (1920, 1080)
+# raw photos may be taller, but never wider, than the food image
+MAX_ASPECT_RATIO = FOOD_IMAGE_TARGET_SIZE[0] / FOOD_IMAGE_TARGET_SIZE[1]
+FOOD_THUMB_TARGET_SIZE = (426, 240)
+JPG_QUALITY = 75
+WEBP_QUALITY = 75
+
+# widths of the smaller food images offered to browsers through srcset, on top
+# of the full FOOD_IMAGE_TARGET_SIZE image. All of them keep the 16:9 crop
+RESPONSIVE_WIDTHS = (480, 960, 1440)
+
+# every food image is written once per format, WebP only where Pillow has it.
+# Thumbnails are only ever linked, and packed into the atlases, as JPEG
+IMAGE_FORMATS = {"jpeg": (".jpg", "image/jpeg")}
+if features.check("webp"):
+    IMAGE_FORMATS["webp"] = (".webp", "image/webp")
+
+# Bump PIPELINE_VERSION whenever the processing code changes its output so
+# every derivative is regenerated on the next build
+PIPELINE_VERSION = 3
+IMAGE_SETTINGS = {
+    "version": PIPELINE_VERSION,
+    "food": list(FOOD_IMAGE_TARGET_SIZE),
+    "thumb": list(FOOD_THUMB_TARGET_SIZE),
+    "widths": list(RESPONSIVE_WIDTHS),
+    "formats": list(IMAGE_FORMATS),
+    "quality": {"jpeg": JPG_QUALITY, "webp": WEBP_QUALITY},
+}
+MANIFEST_PATH = Path(".cache/images.json")
+
+# thumbnails are packed into sprite atlases of up to ATLAS_COLUMNS x ATLAS_ROWS
+# tiles so the map can fetch them in a handful of requests. The map page inlines
+# the index, so it is only kept as a build cache
+ATLAS_DIR = Path("img/atlas")
+ATLAS_INDEX = Path(".cache/thumb-atlases.json")
+# lossless copies of the thumbnails the atlases are drawn from, so their tiles
+# are only JPEG compressed once
+ATLAS_TILE_DIR = Path(".cache/thumbs")
+ATLAS_COLUMNS = 8
+ATLAS_ROWS = 8
+
+
+def image_variants(raw_jpg: Path) -> list[dict]:
+    """
+    Describe every derivative generated from a raw photo.
+
+    The full size food image and the thumbnail keep their historical
+    img/food/<slug>.jpg and img/thumb/<slug>.jpg paths; the smaller widths
+    live in img/food/<width>/. Thumbnails are JPEG only.
+    """
+    slug = raw_jpg.stem
+    variants = []
+    for format_, (ext, _) in IMAGE_FORMATS.items():
+        for width in RESPONSIVE_WIDTHS:
+            height = width * FOOD_IMAGE_TARGET_SIZE[1] // FOOD_IMAGE_TARGET_SIZE[0]
+            variants.append(
+                {
+                    "kind": "food",
+                    "format": format_,
+                    "width": width,
+                    "height": height,
+                    "path": f"img/food/{width}/{slug}{ext}",
+                }
+            )
+        variants.append(
+            {
+                "kind": "food",
+                "format": format_,
+                "width": FOOD_IMAGE_TARGET_SIZE[0],
+                "height": FOOD_IMAGE_TARGET_SIZE[1],
+                "path": f"img/food/{slug}{ext}",
+            }
+        )
+    variants.append(
+        {
+            "kind": "thumb",
+            "format": "jpeg",
+            "width": FOOD_THUMB_TARGET_SIZE[0],
+            "height": FOOD_THUMB_TARGET_SIZE[1],
+            "path": f"img/thumb/{slug}.jpg",
+        }
+    )
+    return variants
+
+
+def atlas_tile_path(slug: str) -> Path:
+    return ATLAS_TILE_DIR / f"{slug}.png"
+
+
+def output_paths(raw_jpg: Path) -> list[str]:
+    """Paths (relative to static/) of the derivatives generated from a raw photo"""
+    return [variant["path"] for variant in image_variants(raw_jpg)]
+
+
+def food_image_srcsets(
+    manifest: dict[str, dict], url: Callable[[str], str] = lambda url: url
+) -> dict[str, dict[str, str]]:
+    """
+    Map each place slug to a srcset per MIME type for its food image variants
+
+    e.g. {"a16": {"image/webp": "/img/food/480/a16.webp 480w, ...", ...}}
+
+    :param url: maps each variant's URL to the one it is published at
+    """
+    srcsets = {}
+    for file_name, entry in manifest.items():
+        by_type = {}
+        for format_, (_, mime_type) in IMAGE_FORMATS.items():
+            by_type[mime_type] = ", ".join(
+                f"{url('/' + variant['path'])} {variant['width']}w"
+                for variant in entry["variants"]
+                if variant["kind"] == "food" and variant["format"] == format_
+            )
+        srcsets[Path(file_name).stem] = by_type
+    return srcsets
+
+
+def file_sha256(path: Path) -> str:
+    """Return the hex SHA-256 digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest() -> dict[str, dict]:
+    """
+    Load the image manifest, mapping raw file names to what was generated from them.
+
+    Each entry records the raw file's size, mtime and SHA-256 digest, the
+    pipeline settings it was processed with and its derivative paths. A missing
+    or corrupt manifest just means every image is treated as stale.
+    """
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest: dict[str, dict]) -> None:
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = MANIFEST_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w") as o:
+        json.dump(manifest, o, indent=1, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def manifest_entry(raw_jpg: Path, previous: Optional[dict]) -> dict:
+    """
+    Build the manifest entry describing the current state of a raw photo.
+
+    The digest is only recomputed when the file's size or mtime moved, so an
+    unchanged catalog costs one stat per image.
+    """
+    stat = raw_jpg.stat()
+    if (
+        previous is not None
+        and previous.get("size") == stat.st_size
+        and previous.get("mtime_ns") == stat.st_mtime_ns
+    ):
+        sha256 = previous["sha256"]
+    else:
+        sha256 = file_sha256(raw_jpg)
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha256,
+        "settings": IMAGE_SETTINGS,
+        "outputs": output_paths(raw_jpg),
+        "variants": image_variants(raw_jpg),
+        "tile": str(atlas_tile_path(raw_jpg.stem)),
+    }
+
+
+def is_fresh(entry: dict, previous: Optional[dict]) -> bool:
+    """Whether the derivatives recorded in `previous` are still valid for `entry`"""
+    return (
+        previous is not None
+        and previous.get("sha256") == entry["sha256"]
+        and previous.get("settings") == entry["settings"]
+        and previous.get("outputs") == entry["outputs"]
+        and all((STATIC_DIR / fp).exists() for fp in entry["outputs"])
+        and Path(entry["tile"]).exists()
+    )
+
+
+def remove_orphans(manifest: dict[str, dict]) -> int:
+    """Delete derivatives and atlas tiles that no current raw photo generates"""
+    expected = {fp for entry in manifest.values() for fp in entry["outputs"]}
+    removed = 0
+    for img_type in ["food", "thumb"]:
+        for path in (STATIC_DIR / "img" / img_type).rglob("*"):
+            if path.is_file() and str(path.relative_to(STATIC_DIR)) not in expected:
+                path.unlink()
+                removed += 1
+    tiles = {entry["tile"] for entry in manifest.values()}
+    for path in ATLAS_TILE_DIR.glob("*.png"):
+        if str(path) not in tiles:
+            path.unlink()
+            removed += 1
+    return removed
+
+
+def process_food_image(raw_jpg: Path) -> Optional[str]:
+    """
+    Scale, crop and store every food image and thumbnail variant for one raw photo.
+
+    The photo is decoded once; each width is resized from the same cropped
+    buffer and then encoded in every format. Runs inside a worker process, so
+    failures are returned rather than raised to let the parent report every bad
+    image at once.
+
+    :param raw_jpg: path to the raw photo in raw/food
+    :return: None on success, otherwise a description of the failure
+    """
+    try:
+        with Image.open(raw_jpg) as im:
+            assert (
+                im.size[0] / im.size[1] <= MAX_ASPECT_RATIO
+            ), f"aspect ratio {im.size[0]}x{im.size[1]} is wider than 16:9"
+            # let the JPEG decoder skip to the smallest DCT scale (1/2, 1/4 or
+            # 1/8) that still covers the target size. Since the image is no
+            # wider than 16:9, covering the width also covers the height
+            im.draft("RGB", FOOD_IMAGE_TARGET_SIZE)
+            im = im.convert("RGB")
+            im = im.resize(
+                (
+                    FOOD_IMAGE_TARGET_SIZE[0],
+                    int(FOOD_IMAGE_TARGET_SIZE[0] * im.size[1] / im.size[0]),
+                )
+            )
+            pixels_to_crop = int((im.size[1] - FOOD_IMAGE_TARGET_SIZE[1]) / 2)
+            left, upper, right, lower = (
+                0,
+                pixels_to_crop,
+                FOOD_IMAGE_TARGET_SIZE[0],
+                FOOD_IMAGE_TARGET_SIZE[1] + pixels_to_crop,
+            )
+            im_cropped = im.crop((left, upper, right, lower))
+
+            resized = {FOOD_IMAGE_TARGET_SIZE: im_cropped}
+            for variant in image_variants(raw_jpg):
+                size = (variant["width"], variant["height"])
+                if size not in resized:
+                    resized[size] = im_cropped.resize(size)
+                path = STATIC_DIR / variant["path"]
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # build/ and publish/ hardlink the old file, which Pillow would
+                # overwrite in place under its old fingerprinted name
+                path.unlink(missing_ok=True)
+                if variant["format"] == "webp":
+                    resized[size].save(fp=path, format="WEBP", quality=WEBP_QUALITY)
+                else:
+                    resized[size].save(fp=path, format="JPEG", quality=JPG_QUALITY)
+                if variant["kind"] == "thumb":
+                    resized[size].save(
+                        fp=atlas_tile_path(raw_jpg.stem), format="PNG", compress_level=1
+                    )
+    except Exception as e:
+        return f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+
+
+def process_food_images(
+    jobs: int, profiler: Optional[Profiler] = None
+) -> dict[str, dict]:
+    """
+    Process every raw food photo whose derivatives are missing or stale.
+
+    A derivative is stale when the raw photo's content hash or the pipeline
+    settings differ from what the manifest recorded. Derivatives of deleted
+    photos are removed. Stale images are spread over a pool of `jobs` worker
+    processes (or processed in-line when `jobs` is 1). All failures are
+    collected and reported together before the build is aborted.
+
+    :param profiler: times the "images" stage and each processed image if given
+    :return: the up to date image manifest
+    """
+    profiler = profiler or Profiler(enabled=False)
+    stage = profiler.begin("images")
+    for img_type in ["food", "thumb"]:
+        (STATIC_DIR / "img" / img_type).mkdir(parents=True, exist_ok=True)
+    ATLAS_TILE_DIR.mkdir(parents=True, exist_ok=True)
+
+    previous_manifest = load_manifest()
+    manifest = {}
+    todo = []
+    for raw_jpg in sorted(RAW_DIR.glob("*.jpg")):
+        previous = previous_manifest.get(raw_jpg.name)
+        entry = manifest_entry(raw_jpg, previous)
+        if is_fresh(entry, previous):
+            manifest[raw_jpg.name] = entry
+        else:
+            todo.append((raw_jpg, entry))
+
+    stage.count = len(todo)
+    raw_jpgs = [raw_jpg for raw_jpg, _ in todo]
+    labels = [raw_jpg.name for raw_jpg in raw_jpgs]
+    if jobs == 1 or len(todo) <= 1:
+        results = profiler.map("images", process_food_image, labels, raw_jpgs)
+        failures = _collect_failures(raw_jpgs, results)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = profiler.map(
+                "images",
+                process_food_image,
+                labels,
+                raw_jpgs,
+                mapper=partial(executor.map, chunksize=1),
+            )
+            failures = _collect_failures(raw_jpgs, results)
+
+    failed = {raw_jpg for raw_jpg, _ in failures}
+    for raw_jpg, entry in todo:
+        if raw_jpg not in failed:
+            manifest[raw_jpg.name] = entry
+    save_manifest(manifest)
+
+    removed = remove_orphans(manifest)
+    if removed:
+        print(f"Removed {removed} orphaned image derivative(s)")
+
+    if failures:
+        for raw_jpg, error in failures:
+            print(f"{raw_jpg}: {error}")
+        raise click.ClickException(f"{len(failures)} food image(s) failed to process")
+
+    return manifest
+
+
+def _collect_failures(todo, results) -> list[tuple[Path, str]]:
+    failures = []
+    for raw_jpg, error in tqdm(
+        zip(todo, results), total=len(todo), desc="processing food images"
+    ):
+        if error is not None:
+            failures.append((raw_jpg, error))
+    return failures
+
+
+def build_thumb_atlases(manifest: dict[str, dict]) -> dict:
+    """
+    Pack every thumbnail into sprite atlases and write their offset index.
+
+    The tiles are pasted from the lossless copies in ATLAS_TILE_DIR rather than
+    the JPEG thumbnails, so they are not compressed twice. The index
+    (ATLAS_INDEX) looks like
+    {
+        "key": "<digest of the inputs>",
+        "tile": [426, 240],
+        "atlases": [{"url": "/img/atlas/thumbs-0.jpg", "size": [3408, 1920]}, ...],
+        "thumbs": {"<slug>": [<atlas number>, <x>, <y>], ...}
+    }
+    The atlases are only redrawn when a thumbnail or the layout changed.
+
+    :return: the atlas index
+    """
+    thumbs = sorted(
+        (Path(file_name).stem, entry["sha256"]) for file_name, entry in manifest.items()
+    )
+    key = hashlib.sha256(
+        json.dumps([thumbs, IMAGE_SETTINGS, ATLAS_COLUMNS, ATLAS_ROWS]).encode()
+    ).hexdigest()
+
+    try:
+        with open(ATLAS_INDEX) as f:
+            index = json.load(f)
+        if index["key"] == key and all(
+            (STATIC_DIR / atlas["url"].lstrip("/")).exists()
+            for atlas in index["atlases"]
+        ):
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+
+    (STATIC_DIR / ATLAS_DIR).mkdir(parents=True, exist_ok=True)
+    for path in (STATIC_DIR / ATLAS_DIR).iterdir():
+        path.unlink()
+
+    tile_width, tile_height = FOOD_THUMB_TARGET_SIZE
+    per_atlas = ATLAS_COLUMNS * ATLAS_ROWS
+    index = {"key": key, "tile": [tile_width, tile_height], "atlases": [], "thumbs": {}}
+    for atlas_number, start in enumerate(range(0, len(thumbs), per_atlas)):
+        chunk = thumbs[start : start + per_atlas]
+        columns = min(len(chunk), ATLAS_COLUMNS)
+        rows = -(-len(chunk) // ATLAS_COLUMNS)
+        atlas = Image.new("RGB", (columns * tile_width, rows * tile_height), "white")
+        for position, (slug, _) in enumerate(chunk):
+            x = position % ATLAS_COLUMNS * tile_width
+            y = position // ATLAS_COLUMNS * tile_height
+            with Image.open(atlas_tile_path(slug)) as im:
+                atlas.paste(im, (x, y))
+            index["thumbs"][slug] = [atlas_number, x, y]
+        atlas_fp = ATLAS_DIR / f"thumbs-{atlas_number}.jpg"
+        atlas.save(fp=STATIC_DIR / atlas_fp, format="JPEG", quality=JPG_QUALITY)
+        index["atlases"].append({"url": f"/{atlas_fp}", "size": list(atlas.size)})
+
+    ATLAS_INDEX.parent.mkdir(parents=True, exist_ok=True)
+    with open(ATLAS_INDEX, "w") as o:
+        json.dump(index, o, separators=(",", ":"))
+    return index
@@ -70,6 +70,7 @@ class InstagramBot:
         self.close_popup("Cancel")
 
     def upload_post(self, place):
+        """Post the social card of a place, given as Place.to_social_card()"""
         # click around to avoid detection
         self.click(self.driver.find_elements(By.CSS_SELECTOR, '[aria-label="Home"]')[0])
         self.click(self.driver.find_elements(By.CSS_SELECTOR, '[aria-label="Home"]')[1])
@@ -0,0 +1,131 @@
+"""
+Module to check the catalog for problems without a browser or a build
+"""
+
+import re
+import time
+from collections.abc import Hashable
+from pathlib import Path
+
+import click
+import yaml
+from PIL import Image, UnidentifiedImageError
+
+from .images import MAX_ASPECT_RATIO, RAW_DIR
+from .places import UNIQUE_FIELDS, Place, PlaceCache, parse_place
+
+PLACES_DIR = Path("places")
+
+
+def lint_place(place_md: Path, cache: PlaceCache) -> tuple[Place | None, list[str]]:
+    """
+    Check a single review the way the build would.
+
+    :return: (place, problems); place is None if the review could not be parsed
+    """
+    slug = place_md.stem
+    if not re.match(r"^[0-9a-z-]+$", slug):
+        return None, ["bad filename, slugs are lowercase letters, digits and dashes"]
+    text = place_md.read_text()
+    if text.count("---") < 2:
+        return None, ["missing --- delimited frontmatter"]
+    try:
+        frontmatter, _, blurb = parse_place(text, cache)
+    except yaml.YAMLError as e:
+        return None, [f"invalid frontmatter: {e}"]
+    try:
+        place = Place.from_frontmatter(slug, frontmatter, blurb, {})
+    except (AssertionError, TypeError, ValueError) as e:
+        return None, [str(e)]
+    problems = []
+    _, _, md = text.split("---", 2)
+    if place.taste >= 1 and "**" not in md:
+        problems.append("no **highlighted** food in a review tasting SGFI or better")
+    return place, problems
+
+
+def lint_duplicates(places: dict[Path, Place]) -> dict[Path, list[str]]:
+    """Report every place sharing a UNIQUE_FIELDS value with an earlier one"""
+    problems = {}
+    for field in UNIQUE_FIELDS:
+        first_seen = {}
+        for place_md, place in places.items():
+            value = getattr(place, field)
+            if value is None:
+                continue
+            # e.g. a name given as a YAML list
+            key = value if isinstance(value, Hashable) else repr(value)
+            if key in first_seen:
+                problems.setdefault(place_md, []).append(
+                    f"{field} is already used by {first_seen[key]}"
+                )
+            else:
+                first_seen[key] = place_md
+    return problems
+
+
+def lint_image(raw_jpg: Path) -> tuple[list[str], list[str]]:
+    """
+    Check a raw food photo, reading only its header.
+
+    :return: (problems, warnings)
+    """
+    try:
+        # Image.open parses the header and defers decoding the pixels
+        with Image.open(raw_jpg) as im:
+            width, height = im.size
+            image_format = im.format
+    except (OSError, UnidentifiedImageError) as e:
+        return [f"unreadable image: {e}"], []
+    problems = []
+    warnings = []
+    if width / height > MAX_ASPECT_RATIO:
+        problems.append(f"aspect ratio {width}x{height} is wider than 16:9")
+    if image_format != "JPEG":
+        # Pillow still decodes it, it is just larger than it needs to be
+        warnings.append(f"is a {image_format} file, not a JPEG")
+    return problems, warnings
+
+
+@click.command()
+def lint_vilf() -> None:
+    """
+    Check every review in places/ and photo in raw/food, reporting all problems at once
+    """
+    start = time.perf_counter()
+    problems = {}
+    places = {}
+    cache = PlaceCache()
+    place_mds = sorted(PLACES_DIR.glob("*.md"))
+    for place_md in place_mds:
+        place, place_problems = lint_place(place_md, cache)
+        if place is not None:
+            places[place_md] = place
+        if place_problems:
+            problems[place_md] = place_problems
+    for place_md, place_problems in lint_duplicates(places).items():
+        problems.setdefault(place_md, []).extend(place_problems)
+
+    raw_jpgs = sorted(RAW_DIR.glob("*.jpg"))
+    slugs = {place_md.stem for place_md in place_mds}
+    for raw_jpg in raw_jpgs:
+        image_problems, warnings = lint_image(raw_jpg)
+        if raw_jpg.stem not in slugs:
+            # harmless for the build, which just never links to it
+            warnings.append(f"no review in {PLACES_DIR} for this photo")
+        for warning in warnings:
+            print(f"{raw_jpg}: warning: {warning}")
+        if image_problems:
+            problems[raw_jpg] = image_problems
+
+    for path in sorted(problems):
+        for problem in problems[path]:
+            print(f"{path}: {problem}")
+    elapsed = time.perf_counter() - start
+    summary = (
+        f"{len(place_mds)} reviews and {len(raw_jpgs)} photos in {elapsed * 1000:.0f}ms"
+    )
+    if problems:
+        count = sum(len(path_problems) for path_problems in problems.values())
+        raise click.ClickException(f"{count} problem(s) found checking {summary}")
+    print(f"No problems found checking {summary}")
@@ -0,0 +1,108 @@
+"""
+Module to split the listing pages into fixed-size pages with JSON feeds
+"""
+import json
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+from .places import Place, cuisine_slug
+
+# places per listing page and per feed shard
+LISTING_PAGE_SIZE = 50
+
+
+@dataclass
+class ListingPage:
+    """
+    One page of a listing, e.g. /best/page/2/.
+
+    Its places are also published as a JSON feed shard, which the previous
+    page fetches to show them without navigating.
+    """
+
+    base_url: str
+    number: int
+    pages: int
+    places: list[Place]
+
+    @property
+    def url(self) -> str:
+        return page_url(self.base_url, self.number)
+
+    @property
+    def feed_url(self) -> str:
+        return feed_url(self.base_url, self.number)
+
+    @property
+    def prev_url(self) -> Optional[str]:
+        return page_url(self.base_url, self.number - 1) if self.number > 1 else None
+
+    @property
+    def next_url(self) -> Optional[str]:
+        if self.number == self.pages:
+            return None
+        return page_url(self.base_url, self.number + 1)
+
+    @property
+    def next_feed_url(self) -> Optional[str]:
+        if self.number == self.pages:
+            return None
+        return feed_url(self.base_url, self.number + 1)
+
+
+def page_url(base_url: str, number: int) -> str:
+    """e.g. /best/ for the first page, /best/page/2/ for the second"""
+    return base_url if number == 1 else f"{base_url}page/{number}/"
+
+
+def feed_url(base_url: str, number: int) -> str:
+    """e.g. /best/feed/1.json"""
+    return f"{base_url}feed/{number}.json"
+
+
+def paginate(
+    places: list[Place], base_url: str, size: int = LISTING_PAGE_SIZE
+) -> list[ListingPage]:
+    """Split places, already in listing order, into pages; always at least one"""
+    pages = max(1, math.ceil(len(places) / size))
+    return [
+        ListingPage(
+            base_url, number, pages, places[(number - 1) * size : number * size]
+        )
+        for number in range(1, pages + 1)
+    ]
+
+
+def listing_item(place: Place) -> dict:
+    """What listing pages show of a place, as in listing.html"""
+    return {
+        "url": place.url,
+        "name": place.name,
+        "address": place.address,
+        "area": place.area,
+        "cuisine": place.cuisine,
+        "cuisine_url": f"/cuisines/{cuisine_slug(place.cuisine)}/",
+        "taste_label": place.taste_label,
+        "taste_color": place.taste_color,
+        "value_label": place.value_label,
+        "value_color": place.value_color,
+        "visited_display": place.visited_display,
+        "blurb": place.blurb,
+    }
+
+
+def encode_feed(page: ListingPage) -> str:
+    """The JSON feed shard of a page, linking to the next one"""
+    return json.dumps(
+        {
+            "page": page.number,
+            "pages": page.pages,
+            "url": page.url,
+            "next": page.next_feed_url,
+            "next_url": page.next_url,
+            "places": [listing_item(place) for place in page.places],
+        },
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
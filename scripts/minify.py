@@ -0,0 +1,88 @@
+"""
+Module to shrink rendered HTML without changing how it renders
+"""
+import re
+
+# elements whose content is kept verbatim or minified by its own rules
+RAW_ELEMENTS = ["pre", "textarea", "script", "style"]
+_TOKEN_RE = re.compile(
+    r"(?P<raw><(?P<raw_tag>"
+    + "|".join(RAW_ELEMENTS)
+    + r")\b[^>]*>.*?</(?P=raw_tag)\s*>)"
+    r"|(?P<comment><!--.*?-->)"
+    r"|(?P<tag><[^>]*>)",
+    re.DOTALL | re.IGNORECASE,
+)
+_WHITESPACE_RE = re.compile(r"\s+")
+_CSS_TOKEN_RE = re.compile(
+    r"""(?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(?P<comment>/\*.*?\*/)""",
+    re.DOTALL,
+)
+# whitespace around CSS punctuation that never needs it
+_CSS_PUNCTUATION_RE = re.compile(r"\s*([{};,])\s*")
+
+
+def _minify_css_code(css: str) -> str:
+    css = _WHITESPACE_RE.sub(" ", css)
+    return _CSS_PUNCTUATION_RE.sub(r"\1", css).replace(";}", "}")
+
+
+def minify_css(css: str) -> str:
+    """Drop comments and redundant whitespace from a stylesheet, sparing strings"""
+    out = []
+    code = []
+    position = 0
+    for match in _CSS_TOKEN_RE.finditer(css):
+        code.append(css[position : match.start()])
+        if match["string"]:
+            out.append(_minify_css_code("".join(code)))
+            out.append(match["string"])
+            code = []
+        else:
+            # a comment separates tokens like whitespace does
+            code.append(" ")
+        position = match.end()
+    code.append(css[position:])
+    out.append(_minify_css_code("".join(code)))
+    return "".join(out).strip()
+
+
+def _minify_raw(element: str, tag: str) -> str:
+    if tag.lower() != "style":
+        # <pre> and <textarea> render their whitespace, and scripts are not
+        # worth the risk without a JavaScript tokenizer
+        return element
+    start = element.index(">") + 1
+    end = element.rindex("<")
+    return element[:start] + minify_css(element[start:end]) + element[end:]
+
+
+def minify_html(html: str) -> str:
+    """
+    Collapse whitespace and strip comments from an HTML document.
+
+    Runs of whitespace in text are collapsed to a single space, which browsers
+    render identically. Tags are kept as written so attribute values are never
+    touched, and the content of <pre>, <textarea> and <script> is left alone.
+    Inline <style> sheets are minified. Conditional comments are kept.
+    """
+    out = []
+    position = 0
+    for match in _TOKEN_RE.finditer(html):
+        out.append(_WHITESPACE_RE.sub(" ", html[position : match.start()]))
+        if match["raw"]:
+            out.append(_minify_raw(match["raw"], match["raw_tag"]))
+        elif match["comment"]:
+            if match["comment"].startswith("<!--["):
+                out.append(match["comment"])
+        else:
+            out.append(match["tag"])
+        position = match.end()
+    out.append(_WHITESPACE_RE.sub(" ", html[position:]))
+    return "".join(out).strip()
+
+
+assert minify_html("<p>\n  a  <b>b</b>\n</p><!-- c -->") == "<p> a <b>b</b> </p>"
+assert minify_html("<pre>\n  a\n</pre>") == "<pre>\n  a\n</pre>"
+assert minify_css(".a {\n  color: red;\n}\n/* b */") == ".a{color: red}"
+assert minify_css("a { font: 'x ,  y' ; }") == "a{font: 'x ,  y'}"
@@ -0,0 +1,163 @@
+"""
+Module to find the nearest places to every place with a k-d tree
+"""
+import heapq
+import math
+from typing import Optional
+
+from .places import Place
+
+# places listed as nearby on each place page
+NEARBY_COUNT = 5
+# places further than this are never nearby, however few are closer
+NEARBY_MAX_MILES = 5
+EARTH_RADIUS_MILES = 3958.8
+
+
+def unit_vector(lat: float, lon: float) -> tuple[float, float, float]:
+    """A point on the Earth as a point on the unit sphere"""
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (
+        math.cos(lat) * math.cos(lon),
+        math.cos(lat) * math.sin(lon),
+        math.sin(lat),
+    )
+
+
+def chord_to_miles(chord: float) -> float:
+    """Distance along the Earth's surface between unit vectors chord apart"""
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(chord / 2, 1))
+
+
+def miles_to_chord(miles: float) -> float:
+    return 2 * math.sin(min(miles / (2 * EARTH_RADIUS_MILES), math.pi / 2))
+
+
+assert abs(chord_to_miles(miles_to_chord(3.0)) - 3.0) < 1e-9
+
+
+class KDTree:
+    """
+    A 3-d tree over points on the unit sphere.
+
+    Searching by the straight line distance between unit vectors orders points
+    exactly as the distance along the surface does, with no special cases at
+    the poles or the antimeridian. Building sorts the points once per axis and
+    splits those orders at every level, O(n log n) in all, and a nearest
+    neighbour query visits O(log n) nodes on average.
+    """
+
+    def __init__(self, points: list[tuple[float, float, float]]):
+        self.points = points
+        self.root = self._build(
+            [
+                sorted(range(len(points)), key=lambda i: points[i][axis])
+                for axis in range(3)
+            ],
+            0,
+        )
+
+    def _build(self, orders: list[list[int]], depth: int) -> Optional[tuple]:
+        """
+        Node: (index of the point split on, axis, left subtree, right subtree)
+
+        :param orders: the indices of the subtree's points sorted along each
+                       axis, which splitting keeps sorted for the children
+        """
+        axis = depth % 3
+        indices = orders[axis]
+        if not indices:
+            return None
+        middle = len(indices) // 2
+        split = indices[middle]
+        left = set(indices[:middle])
+        return (
+            split,
+            axis,
+            self._build(
+                [[i for i in order if i in left] for order in orders], depth + 1
+            ),
+            self._build(
+                [
+                    [i for i in order if i not in left and i != split]
+                    for order in orders
+                ],
+                depth + 1,
+            ),
+        )
+
+    def nearest(
+        self,
+        point: tuple[float, float, float],
+        k: int,
+        max_distance: float = math.inf,
+        exclude: Optional[int] = None,
+    ) -> list[tuple[float, int]]:
+        """
+        The k points nearest point, no further than max_distance from it.
+
+        :param exclude: index of a point never returned, e.g. point itself
+        :return: [(distance, index), ...] nearest first
+        """
+        # max-heap of the best found so far as (-squared distance, index)
+        best = []
+        bound = max_distance**2
+        # (node, squared distance from point to the region of the node)
+        stack = [(self.root, 0.0)]
+        while stack:
+            node, region = stack.pop()
+            # the bound may have shrunk since the node was pushed
+            if node is None or region > bound:
+                continue
+            index, axis, left, right = node
+            other = self.points[index]
+            squared = (
+                (point[0] - other[0]) ** 2
+                + (point[1] - other[1]) ** 2
+                + (point[2] - other[2]) ** 2
+            )
+            if index != exclude and squared <= bound:
+                heapq.heappush(best, (-squared, index))
+                if len(best) > k:
+                    heapq.heappop(best)
+                if len(best) == k:
+                    bound = -best[0][0]
+            offset = point[axis] - other[axis]
+            near, far = (left, right) if offset < 0 else (right, left)
+            stack.append((far, max(region, offset**2)))
+            stack.append((near, region))
+        return sorted((math.sqrt(-squared), index) for squared, index in best)
+
+
+def nearby_places(
+    places: list[Place], k: int = NEARBY_COUNT, max_miles: float = NEARBY_MAX_MILES
+) -> dict[str, list[tuple[Place, float]]]:
+    """
+    The k nearest other places to every place, within max_miles.
+
+    :return: {slug: [(place, miles), ...] nearest first}
+    """
+    tree = KDTree([unit_vector(place.lat, place.lon) for place in places])
+    max_chord = miles_to_chord(max_miles)
+    return {
+        place.slug: [
+            (places[index], chord_to_miles(chord))
+            for chord, index in tree.nearest(point, k, max_chord, exclude=i)
+        ]
+        for i, (place, point) in enumerate(zip(places, tree.points))
+    }
+
+
+def nearby_context(nearby: list[tuple[Place, float]]) -> list[dict]:
+    """What place.html lists of each nearby place"""
+    return [
+        {
+            "name": place.name,
+            "url": place.url,
+            "cuisine": place.cuisine,
+            "taste_label": place.taste_label,
+            "taste_color": place.taste_color,
+            "distance": f"{miles:.1f} mi" if miles >= 0.05 else "under 0.1 mi",
+        }
+        for place, miles in nearby
+    ]
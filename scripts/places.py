@@ -0,0 +1,566 @@
+"""
+Module to parse place reviews and render their pages
+"""
+
+import hashlib
+import os
+import pickle
+import re
+import sqlite3
+import time
+from dataclasses import asdict, dataclass, field, fields
+from datetime import date
+from functools import cache, cached_property
+from importlib.metadata import version
+from pathlib import Path
+from typing import Any, Optional
+
+import yaml
+from jinja2 import Environment
+from markdown2 import markdown
+from mdplain import plain
+
+from .minify import minify_html
+from .sync import write_if_changed
+from .templates import make_environment
+
+# tuples, so the fragment helpers below can be memoized on them
+taste_labels = ("DNR", "SGFI", "Good", "Phenomenal")
+taste_labels_long = ("Do Not Recommend", "Something Going For It", "Good", "Phenomenal")
+value_labels = ("Bad", "Fine", "Good", "Phenomenal")
+rating_colors = ("#ef422b", "#efa72b", "#32af2d", "#2b9aef")
+faded_color = "#cecece"
+
+boolean_labels = ("Nah", "Yeah")
+boolean_colors = ("#ef422b", "#2b9aef")
+
+PLACE_CACHE_PATH = Path(".cache/places.sqlite")
+PLACE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Bump PARSER_VERSION whenever parse_place changes what it produces. Together
+# with the parser libraries' versions it is part of every cache key
+PARSER_VERSION = 1
+RENDERER_VERSIONS = (
+    f"parser={PARSER_VERSION};"
+    + ";".join(f"{lib}={version(lib)}" for lib in ["PyYAML", "markdown2", "mdplain"])
+).encode()
+
+
+# only a handful of ratings and label sets exist, so every fragment is built once
+# per process however many places share it
+@cache
+def rating_html(rating, rating_labels):
+    return "&nbsp;".join(
+        [
+            f'<span style="color: {color if rating == ix else faded_color}" aria-hidden="{"false" if rating == ix else "true"}">{label}</span>'
+            for ix, (label, color) in enumerate(zip(rating_labels, rating_colors))
+        ]
+    )
+
+
+@cache
+def boolean_html(boolean):
+    return " ".join(
+        [
+            f'<span style="color: {color if boolean == ix else faded_color}" aria-hidden="{"false" if boolean == ix else "true"}">{label}</span>'
+            for ix, (label, color) in enumerate(zip(boolean_labels, boolean_colors))
+        ]
+    )
+
+
+def format_phone_number(number):
+    return f"({number[2:5]}) {number[5:8]}-{number[8:12]}"
+
+
+assert format_phone_number("+12345678987") == "(234) 567-8987"
+
+
+def suffix(d):
+    return "th" if 11 <= d <= 13 else {1: "st", 2: "nd", 3: "rd"}.get(d % 10, "th")
+
+
+def custom_strftime(format_, t):
+    return t.strftime(format_).replace("{S}", str(t.day) + suffix(t.day))
+
+
+def format_visited(visited):
+    return custom_strftime("{S} %B %Y", visited)
+
+
+def format_blurb(md):
+    return " ".join(plain(re.sub(r"\s+", " ", md.strip())).split(" ")[:50]) + "..."
+
+
+def format_highlights(md):
+    """The **highlighted** dishes of a review, in order and without repeats"""
+    return list(
+        dict.fromkeys(
+            re.sub(r"\s+", " ", dish).strip()
+            for dish in re.findall(r"\*\*(.+?)\*\*", md, re.DOTALL)
+        )
+    )
+
+
+assert format_highlights("**a**, **b  c** and **a**") == ["a", "b c"]
+
+
+@dataclass(slots=True)
+class Place:
+    """
+    A reviewed place, validated on construction.
+
+    Labels, colors and other display strings are derived from the stored fields
+    on access. Use the to_* methods to hand a place to the geojson, the templates
+    or the social card generator.
+    """
+
+    slug: str
+    name: str
+    cuisine: str
+    address: str
+    area: Optional[str]
+    lat: float
+    lon: float
+    phone: Optional[str]
+    menu: Optional[str]
+    drinks: bool
+    visited: date
+    taste: int
+    value: int
+    blurb: str
+    instagram_published: bool = False
+    food_image_path: Optional[str] = None
+    food_thumb_path: Optional[str] = None
+    food_image_srcset: Optional[dict[str, str]] = None
+    highlights: list[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        assert re.match(r"^[0-9a-z-]+$", self.slug), f"Bad slug {self.slug}"
+        if isinstance(self.visited, str):
+            self.visited = date.fromisoformat(self.visited)
+        assert isinstance(self.visited, date), f"visited is not a date in {self.slug}"
+        assert self.taste in range(len(taste_labels)), f"Bad taste in {self.slug}"
+        assert self.value in range(len(value_labels)), f"Bad value in {self.slug}"
+        assert isinstance(self.drinks, bool), f"drinks is not a boolean in {self.slug}"
+        assert -90 <= self.lat <= 90 and -180 <= self.lon <= 180, self.slug
+        if self.phone is not None:
+            assert len(self.phone) == 12, self.slug
+            assert self.phone[:2] == "+1", self.slug
+
+    @classmethod
+    def from_frontmatter(
+        cls,
+        slug: str,
+        frontmatter: dict,
+        blurb: str,
+        images: dict,
+        highlights: Optional[list[str]] = None,
+    ) -> "Place":
+        """Build a place from a review's YAML frontmatter, rejecting unknown keys"""
+        if not isinstance(frontmatter, dict):
+            raise ValueError("frontmatter is not a mapping of fields to values")
+        unknown = frontmatter.keys() - FRONTMATTER_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown field(s) {', '.join(sorted(unknown))}")
+        return cls(
+            slug=slug,
+            blurb=blurb,
+            highlights=highlights or [],
+            **frontmatter,
+            **images,
+        )
+
+    @classmethod
+    def from_record(cls, record: dict) -> "Place":
+        return cls(**record)
+
+    def to_record(self) -> dict:
+        """JSON-serialisable fields, the inverse of from_record"""
+        record = asdict(self)
+        record["visited"] = self.visited.isoformat()
+        return record
+
+    @property
+    def url(self) -> str:
+        return f"/places/{self.slug}/"
+
+    @property
+    def geodata(self) -> str:
+        return f"{self.lat},{self.lon}"
+
+    @property
+    def phone_display(self) -> Optional[str]:
+        return format_phone_number(self.phone) if self.phone is not None else None
+
+    @property
+    def visited_display(self) -> str:
+        return format_visited(self.visited)
+
+    @property
+    def review_age(self) -> int:
+        """Days since the visit, so it changes daily and is never stored"""
+        return (date.today() - self.visited).days
+
+    @property
+    def taste_label(self) -> str:
+        return taste_labels[self.taste]
+
+    @property
+    def taste_color(self) -> str:
+        return rating_colors[self.taste]
+
+    @property
+    def value_label(self) -> str:
+        return value_labels[self.value]
+
+    @property
+    def value_color(self) -> str:
+        return rating_colors[self.value]
+
+    @property
+    def drinks_label(self) -> str:
+        return boolean_labels[self.drinks]
+
+    @property
+    def drinks_color(self) -> str:
+        return boolean_colors[self.drinks]
+
+    @property
+    def title(self) -> str:
+        return f"{self.name} — Tasty vegan food in {self.area}, in the San Francisco Bay Area — Vegans In Love with Food"
+
+    @property
+    def description(self) -> str:
+        return f"Read our review on {self.name} at {self.address} in {self.area}, and more tasty vegan {self.cuisine} food in the San Francisco Bay Area from V.I.L.F!"
+
+    def to_geojson_feature(self) -> dict:
+        return {
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": [self.lon, self.lat],
+            },
+            "properties": {key: getattr(self, key) for key in GEOJSON_PROPERTIES},
+        }
+
+    def template_context(self) -> dict[str, Any]:
+        """Variables place.html is rendered with, apart from the review content"""
+        context = {field.name: getattr(self, field.name) for field in fields(self)}
+        for key in TEMPLATE_PROPERTIES:
+            context[key] = getattr(self, key)
+        context["taste_html"] = rating_html(self.taste, taste_labels)
+        context["value_html"] = rating_html(self.value, value_labels)
+        context["drinks_html"] = boolean_html(self.drinks)
+        return context
+
+    def to_social_card(self) -> dict[str, Any]:
+        """The dict ImageGenerator and InstagramBot expect for a place"""
+        return {
+            "slug": self.slug,
+            "url": self.url,
+            "name": self.name,
+            "area": self.area,
+            "address": self.address,
+            "cuisine": self.cuisine,
+            "taste": self.taste,
+            "taste_label": taste_labels_long[self.taste],
+            "taste_label_short": taste_labels[self.taste].lower(),
+            "blurb": self.blurb,
+            "review_age": self.review_age,
+            "instagram_published": self.instagram_published,
+        }
+
+
+# frontmatter keys a review may set
+FRONTMATTER_FIELDS = {field.name for field in fields(Place)} - {
+    "slug",
+    "blurb",
+    "food_image_path",
+    "food_thumb_path",
+    "food_image_srcset",
+    "highlights",
+}
+# fields no two places may share
+UNIQUE_FIELDS = ["name", "lat", "lon", "menu", "phone", "blurb"]
+GEOJSON_PROPERTIES = [
+    "name",
+    "cuisine",
+    "url",
+    "slug",
+    "taste_label",
+    "taste_color",
+    "value_label",
+    "value_color",
+    "food_image_path",
+    "food_thumb_path",
+]
+TEMPLATE_PROPERTIES = [
+    "url",
+    "geodata",
+    "phone_display",
+    "visited_display",
+    "taste_label",
+    "taste_color",
+    "value_label",
+    "value_color",
+    "drinks_label",
+    "drinks_color",
+    "title",
+    "description",
+]
+
+
+def best_order(place: Place) -> tuple:
+    """Sort key: taste desc, then value desc, then alphabetical by slug"""
+    return (-place.taste, -place.value, place.slug)
+
+
+def latest_order(place: Place) -> tuple:
+    """Sort key: most recently visited first, then best_order"""
+    return (place.review_age, *best_order(place))
+
+
+def cuisine_slug(cuisine: str) -> str:
+    return cuisine.lower().replace(" ", "-")
+
+
+class PlaceIndex:
+    """
+    Places with their sort orders and groupings, computed once per build.
+
+    Every listing is derived from the two sorted orders, so grouping places by
+    another field costs a single pass instead of a scan per group. All lists
+    are shared; callers must not mutate them.
+    """
+
+    def __init__(self, places: list[Place]):
+        self.places = places
+
+    @cached_property
+    def best(self) -> list[Place]:
+        return sorted(self.places, key=best_order)
+
+    @cached_property
+    def latest(self) -> list[Place]:
+        return sorted(self.places, key=latest_order)
+
+    def _group_by(self, field: str) -> dict[Optional[str], list[Place]]:
+        groups = {}
+        for place in self.best:
+            groups.setdefault(getattr(place, field), []).append(place)
+        # places without a value, e.g. area: null, are grouped last under None
+        return dict(
+            sorted(groups.items(), key=lambda item: (item[0] is None, item[0] or ""))
+        )
+
+    @cached_property
+    def by_cuisine(self) -> dict[str, list[Place]]:
+        """Places per cuisine, cuisines alphabetical and places in best order"""
+        return self._group_by("cuisine")
+
+    @cached_property
+    def by_area(self) -> dict[Optional[str], list[Place]]:
+        """Places per area, areas alphabetical and places in best order"""
+        return self._group_by("area")
+
+
+class PlaceCache:
+    """
+    On-disk SQLite cache of parsed reviews.
+
+    Entries hold the YAML frontmatter, the rendered markdown HTML and the plain
+    text blurb of a review, keyed by a digest of the file contents and the parser
+    versions. The cache is only an accelerator: any SQLite error is treated as a
+    miss, so the file can be deleted at any time. Least recently used entries are
+    evicted once the cache grows past max_bytes.
+    """
+
+    def __init__(
+        self, path: Path = PLACE_CACHE_PATH, max_bytes: int = PLACE_CACHE_MAX_BYTES
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._conn = None
+        self._pid = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # connections must not be shared with forked worker processes
+        if self._conn is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS parsed ("
+                "key TEXT PRIMARY KEY, frontmatter BLOB, html TEXT, blurb TEXT, "
+                "size INTEGER, used REAL)"
+            )
+        return self._conn
+
+    def get(self, key: str) -> Optional[tuple[dict, str, str]]:
+        """Return (frontmatter, html, blurb) for key, or None on a miss"""
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT frontmatter, html, blurb FROM parsed WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE parsed SET used = ? WHERE key = ?", (time.time(), key)
+                )
+            return pickle.loads(row[0]), row[1], row[2]
+        except (sqlite3.Error, pickle.UnpicklingError):
+            self._conn = None
+            return None
+
+    def put(self, key: str, frontmatter: dict, html: str, blurb: str) -> None:
+        data = pickle.dumps(frontmatter)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        key,
+                        data,
+                        html,
+                        blurb,
+                        len(key) + len(data) + len(html) + len(blurb),
+                        time.time(),
+                    ),
+                )
+        except sqlite3.Error:
+            self._conn = None
+
+    def prune(self) -> int:
+        """
+        Evict least recently used entries beyond max_bytes.
+
+        :return: the number of entries evicted
+        """
+        try:
+            with self._connect() as conn:
+                total = 0
+                evict = []
+                for key, size in conn.execute(
+                    "SELECT key, size FROM parsed ORDER BY used DESC"
+                ):
+                    total += size
+                    if total > self.max_bytes:
+                        evict.append((key,))
+                conn.executemany("DELETE FROM parsed WHERE key = ?", evict)
+            return len(evict)
+        except sqlite3.Error:
+            self._conn = None
+            return 0
+
+
+def parse_place(text: str, cache: Optional[PlaceCache] = None) -> tuple[dict, str, str]:
+    """
+    Parse a review into its frontmatter, rendered HTML and plain text blurb.
+
+    :param text: contents of the review's markdown file
+    :param cache: cache consulted before, and filled after, parsing
+    :return: (frontmatter, html, blurb); frontmatter is a fresh dict on every call
+    """
+    key = hashlib.sha256(RENDERER_VERSIONS + b"\0" + text.encode()).hexdigest()
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        return cached
+    _, frontmatter, md = text.split("---", 2)
+    meta = yaml.load(frontmatter, Loader=yaml.Loader)
+    html = markdown(md.strip())
+    blurb = format_blurb(md)
+    if cache is not None:
+        cache.put(key, meta, html, blurb)
+    return meta, html, blurb
+
+
+# each worker process builds its own environment and cache connection on first use
+_env: Optional[Environment] = None
+_cache: Optional[PlaceCache] = None
+
+
+def _environment() -> Environment:
+    global _env
+    if _env is None:
+        _env = make_environment()
+    return _env
+
+
+def _place_cache() -> PlaceCache:
+    global _cache
+    if _cache is None:
+        _cache = PlaceCache()
+    return _cache
+
+
+def _load_place(place_md: Path, images: dict) -> tuple[Place, str]:
+    slug = place_md.parts[-1][:-3]
+    with open(place_md) as f:
+        text = f.read()
+    _, _, md = text.split("---", 2)
+    frontmatter, html, blurb = parse_place(text, _place_cache())
+    place = Place.from_frontmatter(
+        slug, frontmatter, blurb, images, format_highlights(md)
+    )
+    if place.taste >= 1:
+        assert "**" in md, f"highlight food in {place.slug}"
+    return place, html
+
+
+def load_place(place_md: Path, images: dict) -> tuple[Optional[Place], Optional[str]]:
+    """
+    Parse and validate a place review.
+
+    Runs inside a worker process, so failures are returned rather than raised
+    to let the parent report them in a deterministic order.
+
+    :param place_md: path to the review in places/
+    :param images: food image paths and srcsets of the place
+    :return: (place, None) on success, otherwise (None, description of the failure)
+    """
+    try:
+        return _load_place(place_md, images)[0], None
+    except Exception as e:
+        return None, str(e)
+
+
+def render_place_page(
+    place_md: Path,
+    images: dict,
+    out_path: Path,
+    minify: bool = False,
+    nearby: Optional[list[dict]] = None,
+) -> tuple[Optional[Place], Optional[str], Optional[tuple[int, int]]]:
+    """
+    Parse a place review, render its page to out_path and return the place.
+
+    Runs inside a worker process like load_place, which has usually parsed the
+    review into the place cache already.
+
+    :param place_md: path to the review in places/
+    :param images: food image paths and srcsets to render the page with
+    :param out_path: where to write the rendered page
+    :param minify: minify the page's HTML
+    :param nearby: the places listed as nearby, see nearby_context in nearby.py
+    :return: (place, None, sizes) on success, otherwise (None, description of the
+             failure, None). sizes is the page's size in bytes before and after
+             minifying, or None if it was not minified
+    """
+    try:
+        place, html = _load_place(place_md, images)
+        rendered = (
+            _environment()
+            .get_template("place.html")
+            .render(**place.template_context(), content=html, nearby=nearby or [])
+        )
+        sizes = None
+        if minify:
+            minified = minify_html(rendered)
+            sizes = (len(rendered.encode()), len(minified.encode()))
+            rendered = minified
+        write_if_changed(out_path, rendered)
+        return place, None, sizes
+    except Exception as e:
+        return None, str(e), None
@@ -0,0 +1,191 @@
+"""
+Module to time the stages of a build and the items processed within them
+"""
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+# how many of the slowest items to list per stage
+SLOWEST_COUNT = 5
+
+
+def _cpu_time() -> float:
+    """CPU time of this process and of its reaped worker processes"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _timed_call(fn: Callable, *args) -> tuple[Any, tuple[float, float, float, int]]:
+    """Call fn, returning its result with (start, wall, cpu, pid) of the call"""
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    result = fn(*args)
+    span = (
+        start,
+        time.perf_counter() - start,
+        time.process_time() - cpu_start,
+        os.getpid(),
+    )
+    return result, span
+
+
+@dataclass
+class Stage:
+    name: str
+    start: float
+    wall: float = 0.0
+    cpu: float = 0.0
+    # number of items the stage processed, if it processes items
+    count: Optional[int] = None
+
+
+@dataclass
+class Item:
+    stage: str
+    name: str
+    start: float
+    wall: float
+    cpu: float
+    pid: int
+
+
+@dataclass
+class Profiler:
+    """
+    Collects wall and CPU time per build stage and per item within a stage.
+
+    A disabled profiler still runs everything it is handed, it just records
+    nothing, so the build can use one unconditionally.
+
+    Stage CPU times include worker processes once they have been reaped, i.e.
+    after their pool has shut down. Item times are measured in whichever
+    process ran the item.
+    """
+
+    enabled: bool = True
+    stages: list[Stage] = field(default_factory=list)
+    items: list[Item] = field(default_factory=list)
+
+    _current: Optional[Stage] = field(default=None, init=False, repr=False)
+    _cpu_start: float = field(default=0.0, init=False, repr=False)
+
+    def begin(self, name: str) -> Stage:
+        """
+        End the running stage, if any, and start timing the next one.
+
+        Set .count on the returned stage to record how many items it processed.
+        """
+        self.end()
+        self._current = Stage(name, time.perf_counter())
+        self._cpu_start = _cpu_time()
+        return self._current
+
+    def end(self) -> None:
+        """End the running stage, if any"""
+        stage = self._current
+        if stage is None:
+            return
+        stage.wall = time.perf_counter() - stage.start
+        stage.cpu = _cpu_time() - self._cpu_start
+        if self.enabled:
+            self.stages.append(stage)
+        self._current = None
+
+    def map(
+        self,
+        stage: str,
+        fn: Callable,
+        labels: Iterable[str],
+        *iterables: Iterable,
+        mapper: Callable = map,
+    ) -> Iterator:
+        """
+        Lazily yield mapper(fn, *iterables), timing each call under its label.
+
+        :param mapper: map or e.g. an executor's map; fn is wrapped in a picklable
+                       partial so it can still run in worker processes
+        """
+        if not self.enabled:
+            yield from mapper(fn, *iterables)
+            return
+        results = mapper(partial(_timed_call, fn), *iterables)
+        for label, (result, span) in zip(labels, results):
+            self.items.append(Item(stage, label, *span))
+            yield result
+
+    def summary(self) -> str:
+        """Table of every stage, followed by the slowest items of each stage"""
+        rows = [("stage", "wall s", "cpu s", "items")]
+        for stage in self.stages:
+            count = "" if stage.count is None else str(stage.count)
+            rows.append((stage.name, f"{stage.wall:.3f}", f"{stage.cpu:.3f}", count))
+        total_wall = sum(stage.wall for stage in self.stages)
+        total_cpu = sum(stage.cpu for stage in self.stages)
+        rows.append(("total", f"{total_wall:.3f}", f"{total_cpu:.3f}", ""))
+        widths = [max(len(row[i]) for row in rows) for i in range(4)]
+        lines = [
+            "  ".join(
+                cell.ljust(width) if i == 0 else cell.rjust(width)
+                for i, (cell, width) in enumerate(zip(row, widths))
+            )
+            for row in rows
+        ]
+
+        by_stage = {}
+        for item in self.items:
+            by_stage.setdefault(item.stage, []).append(item)
+        for stage, items in by_stage.items():
+            lines.append("")
+            lines.append(f"slowest of {len(items)} in {stage}:")
+            for item in sorted(items, key=lambda item: -item.wall)[:SLOWEST_COUNT]:
+                lines.append(
+                    f"  {item.wall * 1000:8.1f}ms wall {item.cpu * 1000:8.1f}ms cpu  {item.name}"
+                )
+        return "\n".join(lines)
+
+    def write_trace(self, path: Path) -> None:
+        """
+        Write the stages and items in Chrome's trace event format.
+
+        Open the file in chrome://tracing or https://ui.perfetto.dev. Stages are
+        drawn on the build process' track and items on the track of the process
+        that ran them.
+        """
+        origin = min(
+            [stage.start for stage in self.stages]
+            + [item.start for item in self.items],
+            default=0.0,
+        )
+        build_pid = os.getpid()
+        events = [
+            {
+                "name": stage.name,
+                "cat": "stage",
+                "ph": "X",
+                "ts": (stage.start - origin) * 1e6,
+                "dur": stage.wall * 1e6,
+                "pid": build_pid,
+                "tid": 0,
+                "args": {"cpu_s": stage.cpu, "items": stage.count},
+            }
+            for stage in self.stages
+        ] + [
+            {
+                "name": item.name,
+                "cat": item.stage,
+                "ph": "X",
+                "ts": (item.start - origin) * 1e6,
+                "dur": item.wall * 1e6,
+                "pid": build_pid,
+                "tid": item.pid,
+                "args": {"cpu_s": item.cpu},
+            }
+            for item in self.items
+        ]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as o:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, o)
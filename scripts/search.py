@@ -0,0 +1,78 @@
+"""
+Module to build the prebuilt search index the search page queries
+"""
+import re
+import unicodedata
+
+from .places import Place
+
+# place fields searched, and the weight of a match in each
+SEARCH_FIELDS = {"name": 8, "highlights": 4, "cuisine": 3, "area": 2, "address": 1}
+# terms are sharded by their first few characters, so a query only fetches the
+# shards of its own terms
+SEARCH_PREFIX_LENGTH = 2
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_IGNORED_RE = re.compile(r"[\u0300-\u036f'\u2019]")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Split text into lowercase words without accents or apostrophes.
+
+    Matches tokenize in search.html.
+    e.g. "Rhea's Café" -> ["rheas", "cafe"]
+    """
+    text = _IGNORED_RE.sub("", unicodedata.normalize("NFKD", text.lower()))
+    return _TOKEN_RE.findall(text)
+
+
+assert tokenize("Rhea's Café, 2nd St.") == ["rheas", "cafe", "2nd", "st"]
+
+
+def search_document(place: Place) -> list:
+    """What the search page shows of a place"""
+    return [
+        place.slug,
+        place.name,
+        place.address,
+        place.area,
+        place.cuisine,
+        place.taste_label,
+        place.taste_color,
+    ]
+
+
+def build_search_index(places: list[Place]) -> dict[str, dict]:
+    """
+    Build an inverted index from the words of every place's SEARCH_FIELDS.
+
+    Each posting is doc * len(SEARCH_FIELDS) + the index of the field the term
+    is in, which keeps the index to plain lists of integers. Every shard carries
+    the documents of its own postings, so a query never fetches the catalog.
+
+    :param places: in the order equally good matches are listed
+    :return: {prefix: {"terms": {term: postings}, "documents": {doc: document}}}
+             for the terms starting with each prefix
+    """
+    shards = {}
+    for doc, place in enumerate(places):
+        document = search_document(place)
+        for field_index, field in enumerate(SEARCH_FIELDS):
+            value = getattr(place, field) or ""
+            if isinstance(value, list):
+                value = " ".join(value)
+            for term in dict.fromkeys(tokenize(value)):
+                shard = shards.setdefault(
+                    term[:SEARCH_PREFIX_LENGTH], {"terms": {}, "documents": {}}
+                )
+                shard["terms"].setdefault(term, []).append(
+                    doc * len(SEARCH_FIELDS) + field_index
+                )
+                shard["documents"][doc] = document
+    return {
+        prefix: {
+            "terms": dict(sorted(shard["terms"].items())),
+            "documents": shard["documents"],
+        }
+        for prefix, shard in sorted(shards.items())
+    }
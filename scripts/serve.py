@@ -0,0 +1,123 @@
+"""
+Module to serve build/ locally and rebuild it whenever its sources change
+"""
+
+import os
+import threading
+import time
+import traceback
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import click
+
+from .build import build
+from .images import ATLAS_DIR, STATIC_DIR
+
+WATCHED_PATHS = [
+    Path("places"),
+    Path("html"),
+    Path("static"),
+    Path("raw/food"),
+    Path("about.md"),
+]
+# written by the build itself from raw/food, so never a reason to rebuild
+GENERATED_PATHS = {
+    STATIC_DIR / "img" / "food",
+    STATIC_DIR / "img" / "thumb",
+    STATIC_DIR / ATLAS_DIR,
+}
+POLL_INTERVAL = 0.1  # seconds between checks for changes
+DEBOUNCE = 0.2  # seconds without further changes before rebuilding
+
+
+def snapshot() -> dict[str, tuple[int, int]]:
+    """Return the size and mtime of every file in the watched paths"""
+    state = {}
+    for watched in WATCHED_PATHS:
+        if watched.is_file():
+            stat = watched.stat()
+            state[str(watched)] = (stat.st_size, stat.st_mtime_ns)
+            continue
+        for root, dirs, files in os.walk(watched):
+            dirs[:] = [name for name in dirs if Path(root, name) not in GENERATED_PATHS]
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                state[path] = (stat.st_size, stat.st_mtime_ns)
+    return state
+
+
+def changed_paths(before: dict, after: dict) -> list[str]:
+    return sorted(
+        path
+        for path in before.keys() | after.keys()
+        if before.get(path) != after.get(path)
+    )
+
+
+def timed_build(jobs: int) -> None:
+    start = time.perf_counter()
+    try:
+        build(jobs)
+    except (Exception, SystemExit):
+        # keep serving the last good build until the next change
+        traceback.print_exc()
+        print(f"Rebuild failed after {time.perf_counter() - start:.2f}s")
+    else:
+        print(f"Rebuilt in {time.perf_counter() - start:.2f}s")
+
+
+@click.command()
+@click.option(
+    "--host", default="localhost", help="Host to serve on (default localhost)."
+)
+@click.option("--port", default=8080, help="Port to serve on (default 8080).")
+@click.option(
+    "--jobs",
+    "-j",
+    default=os.cpu_count() or 1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes for rebuilds (defaults to the CPU count).",
+)
+def serve_vilf(host: str, port: int, jobs: int) -> None:
+    """
+    Build VILF, serve it locally and rebuild whatever changed on every edit.
+
+    Watches places/, html/, static/, raw/food and about.md. Bursts of changes
+    are debounced into a single incremental rebuild.
+    """
+    # snapshot before each build, so an edit saved while it runs triggers the
+    # next one
+    state = snapshot()
+    timed_build(jobs)
+
+    handler = partial(SimpleHTTPRequestHandler, directory="build")
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving build/ at http://{host}:{port}/ (Ctrl+C to stop)")
+
+    try:
+        while True:
+            time.sleep(POLL_INTERVAL)
+            current = snapshot()
+            if current == state:
+                continue
+            # wait for the burst of changes (e.g. an editor's save) to settle
+            while True:
+                time.sleep(DEBOUNCE)
+                settled = snapshot()
+                if settled == current:
+                    break
+                current = settled
+            print("Changed: " + ", ".join(changed_paths(state, current)))
+            state = current
+            timed_build(jobs)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
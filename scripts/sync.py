@@ -0,0 +1,118 @@
+"""
+Module to keep build/ in sync with its sources without rewriting unchanged files
+"""
+import fcntl
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, Optional
+
+# ioctl request to clone a file's extents on copy-on-write filesystems (linux/fs.h)
+FICLONE = 0x40049409
+
+
+def _reflink(src: Path, dst: Path) -> None:
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    shutil.copystat(src, dst)
+
+
+def is_up_to_date(src: Path, dst: Path) -> bool:
+    """Whether dst already holds src, judged by inode or size and mtime"""
+    try:
+        dst_stat = dst.stat()
+    except FileNotFoundError:
+        return False
+    src_stat = src.stat()
+    return (src_stat.st_dev, src_stat.st_ino) == (dst_stat.st_dev, dst_stat.st_ino) or (
+        src_stat.st_size == dst_stat.st_size
+        and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+    )
+
+
+def sync_file(src: Path, dst: Path) -> bool:
+    """
+    Make dst a copy of src, preferring a hardlink, then a reflink, then a copy.
+
+    Copies keep src's mtime so the next sync can skip them on a stat alone.
+    As dst may share src's inode, whatever writes src must replace the file
+    (unlink or os.replace) rather than write into it.
+
+    :return: whether dst had to be (re)created
+    """
+    if is_up_to_date(src, dst):
+        return False
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        try:
+            _reflink(src, dst)
+        except OSError:
+            dst.unlink(missing_ok=True)
+            shutil.copy2(src, dst)
+    return True
+
+
+def sync_tree(
+    src_dir: Path,
+    dst_dir: Path,
+    rename: Optional[Callable[[Path], Path]] = None,
+) -> set[Path]:
+    """
+    Mirror every file under src_dir into dst_dir, touching only what changed.
+
+    :param rename: maps a file's path relative to src_dir to its path relative
+                   to dst_dir, if it should not keep it
+    :return: the paths written under dst_dir, whether or not they changed
+    """
+    synced = set()
+    changed = 0
+    for root, _, files in os.walk(src_dir):
+        for name in files:
+            src = Path(root) / name
+            relative = src.relative_to(src_dir)
+            dst = dst_dir / (rename(relative) if rename else relative)
+            changed += sync_file(src, dst)
+            synced.add(dst)
+    print(f"Synced {src_dir} to {dst_dir} ({changed} of {len(synced)} files changed)")
+    return synced
+
+
+def write_if_changed(path: Path, content: str) -> bool:
+    """
+    Write a generated text file, leaving it untouched if the content is the same.
+
+    :return: whether the file was written
+    """
+    data = content.encode()
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    # never write through a hardlink into a source file
+    path.unlink(missing_ok=True)
+    path.write_bytes(data)
+    return True
+
+
+def prune_tree(dst_dir: Path, keep: set[Path]) -> int:
+    """
+    Delete files under dst_dir that are not in keep, along with emptied directories.
+
+    :return: the number of files removed
+    """
+    removed = 0
+    for root, dirs, files in os.walk(dst_dir, topdown=False):
+        for name in files:
+            path = Path(root) / name
+            if path not in keep:
+                path.unlink()
+                removed += 1
+        for name in dirs:
+            path = Path(root) / name
+            if not any(path.iterdir()):
+                path.rmdir()
+    return removed
@@ -0,0 +1,23 @@
+"""
+Module to set up the Jinja environment the site's pages are rendered with
+"""
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+SITE_URL = "https://vilf.org"
+TEMPLATE_DIR = Path("html")
+# compiled templates, keyed by a checksum of their source so a template is only
+# compiled again after it changes
+TEMPLATE_CACHE_DIR = Path(".cache/jinja")
+
+
+def make_environment() -> Environment:
+    """Return a Jinja environment loading templates from html/"""
+    TEMPLATE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+    )
+    env.globals["SITE_URL"] = SITE_URL
+    return env
@@ -0,0 +1,39 @@
+"""
+Module to split the places shown on the map into z/x/y tiles
+"""
+import math
+
+from .places import Place
+
+# zoom level of the tiles, a tile is about 30km across in the Bay Area
+TILE_ZOOM = 10
+
+
+def tile_of(lon: float, lat: float, zoom: int = TILE_ZOOM) -> tuple[int, int]:
+    """
+    Return the x and y of the Web Mercator (slippy map) tile containing a point.
+
+    Matches lngLatToTile in map.html.
+    """
+    n = 2**zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_places(
+    places: list[Place], zoom: int = TILE_ZOOM
+) -> dict[tuple[int, int], list[tuple[int, Place]]]:
+    """
+    Group places by the tile they fall in, keeping each place's rank in places.
+
+    The map draws features in rank order across tiles, so the ranks let it
+    restore the order of places however the tiles are fetched.
+
+    :return: {(x, y): [(rank, place), ...]} in x, y order, ranks ascending
+    """
+    tiles = {}
+    for rank, place in enumerate(places):
+        tiles.setdefault(tile_of(place.lon, place.lat, zoom), []).append((rank, place))
+    return dict(sorted(tiles.items()))